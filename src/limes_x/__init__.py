@@ -1,3 +1,42 @@
-from .workflow import Workflow, InputGroup
-from .execution.modules import ModuleBuilder, ComputeModule, Item, JobContext, JobResult, Params, LoadComputeModules
-from .execution.executors import Job, Executor, HpcExecutor
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+# attributes are imported on first use (PEP 562), so that a job, which only needs
+# execution.modules, doesn't pay for the workflow, the executors and their dependencies
+_LAZY = {
+    "Workflow": ".workflow",
+    "InputGroup": ".workflow",
+    "ModuleBuilder": ".execution.modules",
+    "ComputeModule": ".execution.modules",
+    "Item": ".execution.modules",
+    "JobContext": ".execution.modules",
+    "JobResult": ".execution.modules",
+    "Params": ".execution.modules",
+    "LoadComputeModules": ".execution.modules",
+    "Job": ".execution.executors",
+    "Executor": ".execution.executors",
+    "PoolExecutor": ".execution.executors",
+    "QueueExecutor": ".execution.executors",
+    "HpcExecutor": ".execution.executors",
+    "RetryPolicy": ".execution.retries",
+    "SpeculationPolicy": ".execution.speculation",
+}
+__all__ = list(_LAZY)
+
+if TYPE_CHECKING:
+    from .workflow import Workflow, InputGroup
+    from .execution.modules import ModuleBuilder, ComputeModule, Item, JobContext, JobResult, Params, LoadComputeModules
+    from .execution.executors import Job, Executor, PoolExecutor, QueueExecutor, HpcExecutor
+    from .execution.retries import RetryPolicy
+    from .execution.speculation import SpeculationPolicy
+
+def __getattr__(name: str):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,21 @@
+import argparse
+
+def main(argv: list[str]|None=None):
+    parser = argparse.ArgumentParser(prog="python -m limes_x")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker = commands.add_parser("worker", help="run jobs queued by a workflow using QueueExecutor")
+    worker.add_argument("--workspace", "-w", type=str, required=True)
+    worker.add_argument("--slots", "-s", type=int, default=1, help="jobs to run at once")
+    worker.add_argument("--poll-sec", type=float, default=2, help="how often to check for jobs when idle")
+    worker.add_argument("--idle-exit-sec", type=float, default=None, help="exit after being idle this long, never by default")
+    worker.add_argument("--verbose", "-v", action="store_true")
+    worker.add_argument("--parent-pid", type=int, default=None, help="exit when this process, which started the worker, is gone")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        from .environments.queued import Serve
+        Serve(args.workspace, slots=args.slots, poll_sec=args.poll_sec, idle_exit_sec=args.idle_exit_sec, verbose=args.verbose, parent_pid=args.parent_pid)
+
+if __name__ == '__main__':
+    main()
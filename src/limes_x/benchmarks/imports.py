@@ -0,0 +1,103 @@
+"""import time of the job side of limes_x
+
+imports what a job needs in fresh interpreters with -X importtime, and fails if
+the median exceeds the budget, or if the job side pulls in anything it shouldn't
+
+    python -m limes_x.benchmarks.imports --budget-ms 60 --repeats 5 --json imports.json
+"""
+from __future__ import annotations
+import os, sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+# what _setup.ParseArgs and a module's definition import
+JOB_IMPORT = "from limes_x.execution.modules import ComputeModule, JobContext, JobResult; from limes_x import ModuleBuilder, Item"
+
+# only the workflow's process should ever need these
+FORBIDDEN = [
+    "limes_x.workflow",
+    "limes_x.execution.executors",
+    "limes_x.execution.comms",
+    "sqlite3",
+    "signal",
+    "threading",
+    "subprocess",
+]
+
+def ParseImportTime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """(module, self us, cumulative us, depth) for every line of -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"): continue
+        toks = line[len("import time:"):].split("|")
+        if len(toks) != 3: continue
+        try:
+            self_us, cumulative_us = int(toks[0]), int(toks[1])
+        except ValueError:
+            continue # the header
+        name = toks[2].rstrip()
+        stripped = name.lstrip()
+        depth = (len(name)-len(stripped)-1)//2
+        rows.append((stripped, self_us, cumulative_us, depth))
+    return rows
+
+def Measure(statement: str) -> tuple[list[tuple[str, int, int, int]], list[str]]:
+    """import times and modules loaded by [statement] in a fresh interpreter"""
+    src = str(Path(__file__).absolute().parent.parent.parent)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([src]+[p for p in os.environ.get("PYTHONPATH", "").split(os.pathsep) if p != ""]))
+    cmd = [sys.executable, "-X", "importtime", "-c", f"{statement}; import sys; print(' '.join(sys.modules))"]
+    res = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    if res.returncode != 0:
+        raise RuntimeError(f"import failed:\n{res.stderr}")
+    return ParseImportTime(res.stderr), res.stdout.split()
+
+def Benchmark(statement: str, repeats: int):
+    totals: list[float] = []
+    by_module: dict[str, list[int]] = {}
+    loaded: list[str] = []
+    for _ in range(repeats):
+        rows, loaded = Measure(statement)
+        totals.append(sum(r[1] for r in rows)/1000)
+        for name, self_us, cumulative_us, depth in rows:
+            by_module.setdefault(name, []).append(cumulative_us)
+    top = sorted(((statistics.median(v)/1000, k) for k, v in by_module.items()), reverse=True)
+    return dict(
+        total_ms=statistics.median(totals),
+        runs_ms=totals,
+        top=[(k, ms) for ms, k in top[:15]],
+        forbidden=[m for m in FORBIDDEN if m in loaded],
+    )
+
+def main(argv: list[str]|None=None):
+    parser = argparse.ArgumentParser(description="import time of the job side of limes_x")
+    parser.add_argument("--budget-ms", type=float, default=60)
+    parser.add_argument("--repeats", "-n", type=int, default=5)
+    parser.add_argument("--statement", type=str, default=JOB_IMPORT)
+    parser.add_argument("--json", type=str, default=None, help="also write the report here")
+    args = parser.parse_args(argv)
+
+    report = Benchmark(args.statement, args.repeats)
+    print(f"{args.statement}")
+    print(f"median {report['total_ms']:.1f} ms over {args.repeats} runs, budget {args.budget_ms:.1f} ms")
+    print(f"{'module':<40}{'cumulative ms':>15}")
+    for k, ms in report["top"]:
+        print(f"{k:<40}{ms:>15.1f}")
+
+    ok = True
+    if report["total_ms"] > args.budget_ms:
+        print(f"FAIL: over budget by {report['total_ms']-args.budget_ms:.1f} ms")
+        ok = False
+    if len(report["forbidden"]) > 0:
+        print(f"FAIL: job side imports {', '.join(report['forbidden'])}")
+        ok = False
+
+    if args.json is not None:
+        with open(args.json, 'w') as j:
+            json.dump(dict(report, budget_ms=args.budget_ms, ok=ok), j, indent=4)
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
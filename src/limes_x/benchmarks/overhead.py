@@ -0,0 +1,213 @@
+"""per-job framework overhead of Executor and HpcExecutor
+
+runs N trivial jobs (no shell commands, one string output) through each executor
+and reports the latency of every phase a job pays for, outside of its procedure
+
+    python -m limes_x.benchmarks.overhead --jobs 20 --executors local pool hpc --json overhead.json
+"""
+from __future__ import annotations
+import os, sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Callable
+
+from ..execution.modules import ComputeModule, Item, JobResult, Params
+from ..execution.instances import JobInstance, ItemInstance
+from ..execution.executors import Executor, PoolExecutor, HpcExecutor, Job
+
+INPUT = Item('overhead benchmark input')
+OUTPUT = Item('overhead benchmark output')
+MODULE_NAME = 'overhead_benchmark'
+TMP_ENV = 'LIMESX_BENCHMARK_TMP'
+
+_DEFINITION = f"""\
+from limes_x import ModuleBuilder, Item, JobContext, JobResult
+
+def procedure(context: JobContext) -> JobResult:
+    return JobResult(manifest={{Item('{OUTPUT.key}'): context.job_id}})
+
+MODULE = ModuleBuilder()\\
+    .SetProcedure(procedure)\\
+    .AddInput(Item('{INPUT.key}'), groupby=None)\\
+    .PromiseOutput(Item('{OUTPUT.key}'))\\
+    .SuggestedResources(threads=1, memory_gb=1)\\
+    .SetHome(__file__, name=None)\\
+    .Build()
+"""
+
+def MakeTrivialModule(modules_folder: Path) -> ComputeModule:
+    lib = modules_folder.joinpath(MODULE_NAME).joinpath(ComputeModule.LIB_FOLDER)
+    os.makedirs(lib, exist_ok=True)
+    with open(lib.joinpath(ComputeModule.DEFINITION_FILE_NAME), 'w') as f:
+        f.write(_DEFINITION)
+    return ComputeModule._load(lib.parent)
+
+class PhaseRecorder:
+    def __init__(self) -> None:
+        self.jobs: list[dict[str, float]] = []
+        self._current: dict[str, float] = {}
+
+    def Wrap(self, fn: Callable, phase: str):
+        def _timed(*args, **kwargs):
+            t = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._current[f"{phase}_start"] = t
+                self._current[phase] = self._current.get(phase, 0) + time.time()-t
+        return _timed
+
+    def Begin(self):
+        self._current = {}
+
+    def End(self, total: float, result_json: dict):
+        rec = self._current
+        rec["total"] = total
+
+        # phases reported by the job wrapper(s) from inside the job process
+        inner: dict = result_json.get("timings", {})
+        outer: dict = result_json.get("hpc-wrapper_timings", {})
+        execute_start = rec.pop("execute_start", None)
+        for k, v in inner.items():
+            if k == "start": continue
+            rec[f"job.{k}"] = v
+        for k, v in outer.items():
+            if k == "start": continue
+            rec[f"hpc.{k}"] = v
+        first = outer.get("start", inner.get("start"))
+        if execute_start is not None and first is not None:
+            rec["spawn"] = first - execute_start
+        if "procedure" in inner:
+            rec["overhead"] = total - inner["procedure"]
+        for k in [k for k in rec if k.endswith("_start")]: del rec[k]
+        self.jobs.append(rec)
+
+    def Summarize(self):
+        phases: list[str] = []
+        for rec in self.jobs:
+            for k in rec:
+                if k not in phases: phases.append(k)
+        summary = {}
+        for k in phases:
+            vals = sorted(rec[k] for rec in self.jobs if k in rec)
+            pct = lambda p: vals[min(len(vals)-1, int(p*len(vals)))]
+            summary[k] = dict(
+                mean=sum(vals)/len(vals),
+                p50=pct(0.5),
+                p95=pct(0.95),
+                max=vals[-1],
+            )
+        return summary
+
+def _read_result(workspace: Path, instance: JobInstance) -> dict:
+    path = workspace.joinpath(instance.GetFolderName()).joinpath('result.json')
+    if not path.exists(): return {}
+    with open(path) as j:
+        return json.load(j)
+
+def _run_jobs(executor: Executor, module: ComputeModule, workspace: Path, params: Params, n: int, record: PhaseRecorder):
+    ids: set[str] = set()
+    def _gen_id(l: int):
+        while True:
+            id = uuid.uuid4().hex[:l]
+            if id not in ids: break
+        ids.add(id)
+        return id
+
+    failures = 0
+    for _ in range(n):
+        given = ItemInstance(_gen_id, INPUT, "x")
+        instance = JobInstance(_gen_id, module, {INPUT.key: given})
+        record.Begin()
+        t = time.time()
+        result: JobResult = executor.Run(instance, workspace, params.Copy())
+        total = time.time()-t
+        if result.error_message is not None:
+            failures += 1
+            print(f"job {instance.GetID()} failed: {result.error_message}")
+        record.End(total, _read_result(workspace, instance))
+    return failures
+
+def _instrument(executor: Executor, record: PhaseRecorder):
+    executor._make_job = record.Wrap(executor._make_job, "save_context")
+    executor._get_result = record.Wrap(executor._get_result, "collect_result")
+    if isinstance(executor, HpcExecutor):
+        executor._can_run = record.Wrap(executor._can_run, "io_slot")
+        executor._hpc_procedure = record.Wrap(executor._hpc_procedure, "execute")
+    elif isinstance(executor, PoolExecutor):
+        executor._execute_in_pool = record.Wrap(executor._execute_in_pool, "execute")
+    else:
+        executor._execute_procedure = record.Wrap(executor._execute_procedure, "execute")
+    return executor
+
+def _local_hpc_procedure(job: Job) -> tuple[bool, str]:
+    return job.Shell(job.run_command)
+
+def MakeExecutor(kind: str) -> Executor:
+    if kind == "local":
+        return Executor()
+    elif kind == "pool":
+        return PoolExecutor(workers=1)
+    elif kind == "hpc":
+        return HpcExecutor(hpc_procedure=_local_hpc_procedure, tmp_dir_name=TMP_ENV)
+    raise ValueError(f"unknown executor [{kind}]")
+
+def Benchmark(kind: str, n: int, root: Path) -> tuple[dict, int]:
+    workspace = root.joinpath(f"workspace_{kind}")
+    if workspace.exists(): shutil.rmtree(workspace)
+    os.makedirs(workspace)
+    tmp = root.joinpath(f"node_tmp_{kind}")
+    os.makedirs(tmp, exist_ok=True)
+    os.environ[TMP_ENV] = str(tmp)
+
+    module = MakeTrivialModule(root.joinpath("modules"))
+    params = Params(file_system_wait_sec=0, threads=1, mem_gb=1, reference_folder=root.joinpath("ref"))
+    record = PhaseRecorder()
+    executor = _instrument(MakeExecutor(kind), record)
+
+    here = os.getcwd()
+    os.chdir(workspace) # executors resolve job folders relative to the workspace
+    try:
+        executor.PrepareRun([module], workspace.joinpath("inputs"), params)
+        failures = _run_jobs(executor, module, workspace, params, n, record)
+    finally:
+        os.chdir(here)
+        if isinstance(executor, PoolExecutor): executor.Shutdown()
+    return record.Summarize(), failures
+
+def _print_summary(kind: str, n: int, failures: int, summary: dict):
+    print(f"\n{kind} executor, {n} jobs, {failures} failed (ms)")
+    print(f"{'phase':<28}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for phase, s in summary.items():
+        print(f"{phase:<28}" + "".join(f"{s[k]*1000:>10.1f}" for k in ["mean", "p50", "p95", "max"]))
+
+def main(argv: list[str]|None=None):
+    parser = argparse.ArgumentParser(description="per-job framework overhead of limes_x executors")
+    parser.add_argument("--jobs", "-n", type=int, default=10)
+    parser.add_argument("--executors", nargs="+", default=["local", "pool", "hpc"], choices=["local", "pool", "hpc"])
+    parser.add_argument("--root", type=str, default=None, help="scratch folder, a temporary one is used by default")
+    parser.add_argument("--json", type=str, default=None, help="also write the summary here")
+    args = parser.parse_args(argv)
+
+    # executors pass the coordinator's python path on to each job
+    sys.path = [os.path.abspath(p) for p in sys.path]
+    root = Path(os.path.abspath(args.root)) if args.root is not None else Path(tempfile.mkdtemp(prefix="limes_x-overhead-"))
+    report = {}
+    for kind in args.executors:
+        summary, failures = Benchmark(kind, args.jobs, root)
+        _print_summary(kind, args.jobs, failures, summary)
+        report[kind] = dict(jobs=args.jobs, failures=failures, phases=summary)
+
+    if args.json is not None:
+        with open(args.json, 'w') as j:
+            json.dump(report, j, indent=4)
+    if args.root is None:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""a stand in batch scheduler, to load test HpcExecutor on one linux machine
+
+FakeScheduler queues and runs shell commands with a limited number of slots, a delay for each submission,
+like the round trip to a real scheduler's controller, a delay before queued jobs are eligible to start,
+and optionally, node failures that kill jobs part way through
+
+    python -m limes_x.benchmarks.scheduler --jobs 200 --slots 16 --submit-latency 0.05 --queue-delay 1 --io-slots 4
+"""
+from __future__ import annotations
+import os, sys
+import time
+import json
+import shutil
+import signal
+import random
+import argparse
+import tempfile
+import uuid
+import subprocess
+from pathlib import Path
+from threading import Condition, Lock, Thread, Timer, Event
+
+from ..execution.modules import Params, JobResult
+from ..execution.instances import JobInstance, ItemInstance
+from ..execution.executors import HpcExecutor, Job
+from .overhead import MakeTrivialModule, INPUT, TMP_ENV
+
+class _FakeJob:
+    def __init__(self, id: int, cmd: str, eligible: float) -> None:
+        self.id = id
+        self.cmd = cmd
+        self.submitted = time.time()
+        self.eligible = eligible
+        self.started: float|None = None
+        self.finished: float|None = None
+        self.ok = False
+        self.error = ""
+        self.process: subprocess.Popen|None = None
+        self.done = Event()
+
+class FakeScheduler:
+    """runs submitted shell commands in the background, first come first served, at most [slots] at a time
+    - Submit takes [submit_latency_sec], and submissions are handled one at a time, like sbatch or qsub
+    - a job can't start until [queue_delay_sec] after it was submitted
+    - each started job is killed part way through with probability [failure_rate], as if its node failed
+    """
+    NODE_FAILURE = "NODE_FAIL"
+
+    def __init__(self, slots: int=4, submit_latency_sec: float=0.05, queue_delay_sec: float=0.5, failure_rate: float=0, seed: int|None=None) -> None:
+        self.slots = slots
+        self.submit_latency_sec = submit_latency_sec
+        self.queue_delay_sec = queue_delay_sec
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._controller = Lock()
+        self._cond = Condition()
+        self._jobs: dict[int, _FakeJob] = {}
+        self._pending: list[_FakeJob] = []
+        self._running = 0
+        self.max_running = 0
+        self._stop = False
+        self._dispatcher = Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def Submit(self, cmd: str) -> int:
+        with self._controller:
+            time.sleep(self.submit_latency_sec)
+            with self._cond:
+                job = _FakeJob(len(self._jobs)+1, cmd, time.time()+self.queue_delay_sec)
+                self._jobs[job.id] = job
+                self._pending.append(job)
+                self._cond.notify_all()
+            return job.id
+
+    def Wait(self, id: int) -> tuple[bool, str]:
+        job = self._jobs[id]
+        job.done.wait()
+        return job.ok, job.error
+
+    def _dispatch(self):
+        with self._cond:
+            while not self._stop:
+                now = time.time()
+                while self._running < self.slots and len(self._pending) > 0 and self._pending[0].eligible <= now:
+                    self._start(self._pending.pop(0))
+                timeout = None
+                if self._running < self.slots and len(self._pending) > 0:
+                    timeout = max(0, self._pending[0].eligible-now)
+                self._cond.wait(timeout)
+
+    def _start(self, job: _FakeJob):
+        self._running += 1
+        self.max_running = max(self.max_running, self._running)
+        job.started = time.time()
+        job.process = subprocess.Popen(job.cmd, shell=True, start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        failure = None
+        if self._random.random() < self.failure_rate:
+            failure = Timer(self._random.uniform(0, 1), self._fail, args=(job,))
+            failure.start()
+        Thread(target=self._reap, args=(job, failure), daemon=True).start()
+
+    def _fail(self, job: _FakeJob):
+        if job.process is None or job.process.poll() is not None: return
+        job.error = self.NODE_FAILURE
+        try:
+            os.killpg(job.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self, job: _FakeJob, failure: Timer|None):
+        assert job.process is not None
+        _, err = job.process.communicate()
+        if failure is not None: failure.cancel()
+        job.finished = time.time()
+        job.ok = job.process.returncode == 0 and job.error == ""
+        if not job.ok and job.error == "":
+            job.error = err.decode(errors="replace")[-2000:]
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+        job.done.set()
+
+    def Stats(self) -> dict:
+        with self._cond:
+            finished = [j for j in self._jobs.values() if j.finished is not None]
+            waits = [j.started-j.submitted for j in finished if j.started is not None]
+            return dict(
+                submitted=len(self._jobs),
+                finished=len(finished),
+                failed=sum(1 for j in finished if not j.ok),
+                node_failures=sum(1 for j in finished if j.error == self.NODE_FAILURE),
+                mean_queue_wait=sum(waits)/len(waits) if len(waits) > 0 else 0,
+                max_running=self.max_running,
+            )
+
+    def Shutdown(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+            for j in self._jobs.values():
+                if j.process is not None and j.process.poll() is None:
+                    try:
+                        os.killpg(j.process.pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+
+def HpcProcedure(scheduler: FakeScheduler):
+    """an hpc_procedure for HpcExecutor that submits to [scheduler] and waits, like sbatch --wait"""
+    def _procedure(job: Job) -> tuple[bool, str]:
+        return scheduler.Wait(scheduler.Submit(job.run_command))
+    return _procedure
+
+def Benchmark(n: int, root: Path, scheduler: FakeScheduler, io_slots: int, io_poll_sec: float) -> dict:
+    workspace = root.joinpath("workspace_hpc")
+    if workspace.exists(): shutil.rmtree(workspace)
+    os.makedirs(workspace)
+    tmp = root.joinpath("node_tmp_hpc")
+    os.makedirs(tmp, exist_ok=True)
+    os.environ[TMP_ENV] = str(tmp)
+
+    module = MakeTrivialModule(root.joinpath("modules"))
+    params = Params(file_system_wait_sec=5, threads=1, mem_gb=1, reference_folder=root.joinpath("ref"))
+    executor = HpcExecutor(hpc_procedure=HpcProcedure(scheduler), tmp_dir_name=TMP_ENV)
+    executor.max_active_io_jobs = io_slots
+    executor.update_frequency = io_poll_sec
+
+    # time spent waiting for an io slot, per job
+    io_waits: dict[str, float] = {}
+    can_run = executor._can_run
+    def _timed_can_run(ws: Path, key: str, weight: int=1):
+        t = time.time()
+        ok = can_run(ws, key, weight)
+        if not ok: io_waits[key] = io_waits.get(key, 0)+io_poll_sec+time.time()-t
+        return ok
+    executor._can_run = _timed_can_run
+
+    ids: set[str] = set()
+    def _gen_id(l: int):
+        while True:
+            id = uuid.uuid4().hex[:l]
+            if id not in ids: break
+        ids.add(id)
+        return id
+
+    here = os.getcwd()
+    os.chdir(workspace)
+    done = Condition()
+    results: list[JobResult] = []
+    def _on_done(r: JobResult):
+        with done:
+            results.append(r)
+            done.notify_all()
+    try:
+        executor.PrepareRun([module], workspace.joinpath("inputs"), params)
+        t = time.time()
+        for _ in range(n):
+            instance = JobInstance(_gen_id, module, {INPUT.key: ItemInstance(_gen_id, INPUT, "x")})
+            executor.Submit(instance, workspace, params.Copy(), _on_done)
+        with done:
+            done.wait_for(lambda: len(results) == n)
+        makespan = time.time()-t
+    finally:
+        os.chdir(here)
+
+    failures = [r for r in results if r.error_message is not None]
+    for r in failures[:5]:
+        print(f"job {r.made_by} failed: {str(r.error_message).strip()[:200]}")
+    waits = [io_waits.get(r.made_by, 0) for r in results]
+    return dict(
+        jobs=n,
+        failures=len(failures),
+        makespan=makespan,
+        jobs_per_sec=n/makespan if makespan > 0 else 0,
+        mean_io_slot_wait=sum(waits)/len(waits) if len(waits) > 0 else 0,
+        max_io_slot_wait=max(waits) if len(waits) > 0 else 0,
+        scheduler=scheduler.Stats(),
+    )
+
+def main(argv: list[str]|None=None):
+    parser = argparse.ArgumentParser(description="HpcExecutor throughput against a stand in batch scheduler")
+    parser.add_argument("--jobs", "-n", type=int, default=50)
+    parser.add_argument("--slots", type=int, default=8, help="jobs the scheduler runs at once")
+    parser.add_argument("--submit-latency", type=float, default=0.05, help="seconds per submission")
+    parser.add_argument("--queue-delay", type=float, default=0.5, help="seconds before a submitted job may start")
+    parser.add_argument("--failure-rate", type=float, default=0, help="chance a started job's node fails")
+    parser.add_argument("--io-slots", type=int, default=5, help="HpcExecutor.max_active_io_jobs")
+    parser.add_argument("--io-poll-sec", type=float, default=0.2, help="HpcExecutor.update_frequency")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--root", type=str, default=None, help="scratch folder, a temporary one is used by default")
+    parser.add_argument("--json", type=str, default=None, help="also write the report here")
+    args = parser.parse_args(argv)
+
+    # executors pass the coordinator's python path on to each job
+    sys.path = [os.path.abspath(p) for p in sys.path]
+    root = Path(os.path.abspath(args.root)) if args.root is not None else Path(tempfile.mkdtemp(prefix="limes_x-scheduler-"))
+    scheduler = FakeScheduler(args.slots, args.submit_latency, args.queue_delay, args.failure_rate, seed=args.seed)
+    try:
+        report = Benchmark(args.jobs, root, scheduler, args.io_slots, args.io_poll_sec)
+    finally:
+        scheduler.Shutdown()
+
+    s = report["scheduler"]
+    print(f"\n{report['jobs']} jobs, {report['failures']} failed ({s['node_failures']} node failures), {report['makespan']:.2f}s, {report['jobs_per_sec']:.2f} jobs/s")
+    print(f"scheduler: {s['max_running']} of {args.slots} slots used at most, {s['mean_queue_wait']:.2f}s mean queue wait")
+    print(f"io slots: {report['mean_io_slot_wait']:.2f}s mean wait, {report['max_io_slot_wait']:.2f}s max wait, {args.io_slots} slots")
+
+    if args.json is not None:
+        with open(args.json, 'w') as j:
+            json.dump(report, j, indent=4)
+    if args.root is None:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
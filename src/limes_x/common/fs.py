@@ -0,0 +1,298 @@
+from __future__ import annotations
+import os
+import json
+import time
+import select
+from pathlib import Path
+from typing import Any
+
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb", "smb2", "smbfs", "lustre", "gpfs", "beegfs", "ceph", "glusterfs", "afs", "9p"}
+
+def FileSystemType(path: str|Path) -> str|None:
+    """type of the filesystem that [path] is on, from /proc/mounts (None if unknown)"""
+    path = os.path.realpath(path)
+    best, best_type = "", None
+    try:
+        with open("/proc/mounts") as mounts:
+            for line in mounts:
+                toks = line.split()
+                if len(toks) < 3: continue
+                mount_point = toks[1].replace("\\040", " ")
+                if not (path == mount_point or path.startswith(mount_point.rstrip('/')+'/')): continue
+                if len(mount_point) >= len(best):
+                    best, best_type = mount_point, toks[2]
+    except OSError:
+        return None
+    return best_type
+
+def IsNetworkFileSystem(path: str|Path):
+    fs = FileSystemType(path)
+    if fs is None: return False
+    return fs in NETWORK_FILESYSTEMS or fs.startswith("fuse")
+
+class _Inotify:
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _libc: Any = None
+
+    @classmethod
+    def Available(cls):
+        if cls._libc is None:
+            try:
+                import ctypes, ctypes.util
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                libc.inotify_init1, libc.inotify_add_watch
+                cls._libc = libc
+            except (OSError, AttributeError):
+                cls._libc = False
+        return cls._libc is not False
+
+    def __init__(self, folder: Path) -> None:
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0: raise OSError("inotify_init1 failed")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if self._libc.inotify_add_watch(self.fd, str(folder).encode(), mask) < 0:
+            os.close(self.fd)
+            raise OSError(f"can't watch [{folder}]")
+
+    def Wait(self, timeout: float):
+        # true if something changed in the folder
+        ready, _, _ = select.select([self.fd], [], [], max(0, timeout))
+        if len(ready) == 0: return False
+        try:
+            while len(os.read(self.fd, 4096)) > 0: pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def Close(self):
+        os.close(self.fd)
+
+def WaitForFile(path: str|Path, timeout: float, first_delay: float=0.01, max_delay: float=1) -> bool:
+    """wait up to [timeout] seconds for [path] to exist
+    - on local filesystems, inotify wakes us as soon as the file is created or moved in
+    - otherwise polls with exponential backoff, listing the folder each time,
+    which makes network filesystems revalidate their cached view of it
+    """
+    path = Path(path)
+    if path.exists(): return True
+    if timeout <= 0: return False
+    deadline = time.time() + timeout
+    folder = path.parent
+
+    watcher = None
+    if folder.exists() and _Inotify.Available() and not IsNetworkFileSystem(folder):
+        try:
+            watcher = _Inotify(folder)
+        except OSError:
+            watcher = None
+
+    delay = first_delay
+    try:
+        while True:
+            if path.exists(): return True
+            remaining = deadline - time.time()
+            if remaining <= 0: return False
+            if watcher is not None:
+                watcher.Wait(min(remaining, max_delay))
+            else:
+                time.sleep(min(remaining, delay))
+                delay = min(max_delay, delay*2)
+                try:
+                    os.listdir(folder)
+                except OSError:
+                    pass
+    finally:
+        if watcher is not None: watcher.Close()
+
+def TreeSize(path: str|Path, follow_symlinks: bool=True) -> int:
+    """total bytes of the file or folder at [path], 0 if missing"""
+    seen: set[tuple[int, int]] = set()
+    def _size(p: str):
+        try:
+            st = os.stat(p, follow_symlinks=follow_symlinks)
+        except OSError:
+            return 0
+        if (st.st_dev, st.st_ino) in seen: return 0
+        seen.add((st.st_dev, st.st_ino))
+        if not os.path.isdir(p) or (not follow_symlinks and os.path.islink(p)):
+            return st.st_size
+        total = 0
+        try:
+            with os.scandir(p) as entries:
+                for e in entries: total += _size(e.path)
+        except OSError:
+            pass
+        return total
+    return _size(str(path))
+
+COPY_CHUNK = 1<<26
+
+def _copy_range(fin: int, fout: int, offset: int, length: int):
+    # in kernel copies when possible: copy_file_range, then sendfile, then a large buffer
+    end = offset+length
+    pos = offset
+    if hasattr(os, "copy_file_range"):
+        try:
+            while pos < end:
+                n = os.copy_file_range(fin, fout, min(COPY_CHUNK, end-pos), pos, pos)
+                if n == 0: break
+                pos += n
+            return pos-offset
+        except OSError:
+            pass # cross filesystem on older kernels, or unsupported
+    if hasattr(os, "sendfile"):
+        try:
+            os.lseek(fout, pos, os.SEEK_SET)
+            while pos < end:
+                n = os.sendfile(fout, fin, pos, min(COPY_CHUNK, end-pos))
+                if n == 0: break
+                pos += n
+            return pos-offset
+        except OSError:
+            pass
+    os.lseek(fout, pos, os.SEEK_SET)
+    while pos < end:
+        buf = os.pread(fin, min(COPY_CHUNK, end-pos), pos)
+        if len(buf) == 0: break
+        os.write(fout, buf)
+        pos += len(buf)
+    return pos-offset
+
+FICLONE = 0x40049409
+
+def _reflink(fin: int, fout: int):
+    # copy on write clone, instant on btrfs, xfs, and the like
+    try:
+        import fcntl
+        fcntl.ioctl(fout, FICLONE, fin)
+        return True
+    except (OSError, ImportError):
+        return False
+
+def CopyFile(src: str|Path, dst: str|Path) -> int:
+    """copy the file at [src] to [dst] without passing the data through python where possible
+    - tries a reflink first, then in kernel copies
+    - symlinks are followed, mode and mtime are kept
+    - returns the number of bytes copied
+    """
+    st = os.stat(src)
+    fin = os.open(src, os.O_RDONLY)
+    try:
+        fout = os.open(dst, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, st.st_mode & 0o7777)
+        try:
+            if _reflink(fin, fout):
+                copied = st.st_size
+            else:
+                copied = _copy_range(fin, fout, 0, st.st_size)
+        finally:
+            os.close(fout)
+    finally:
+        os.close(fin)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return copied
+
+def CopyFileRange(src: str|Path, dst: str|Path, offset: int, length: int) -> int:
+    """copy [length] bytes at [offset] of [src] into the same place in [dst], which must already exist
+    - lets large files be copied in parallel chunks
+    """
+    fin = os.open(src, os.O_RDONLY)
+    try:
+        fout = os.open(dst, os.O_WRONLY)
+        try:
+            return _copy_range(fin, fout, offset, length)
+        finally:
+            os.close(fout)
+    finally:
+        os.close(fin)
+
+LINK_STRATEGIES = ["symlink", "hardlink", "reflink", "copy"]
+# what "auto" and each strategy falls back to, in order of preference
+_LINK_FALLBACKS = {
+    "auto":     ["reflink", "hardlink", "copy"],
+    "symlink":  ["symlink"],
+    "hardlink": ["hardlink", "copy"],
+    "reflink":  ["reflink", "copy"],
+    "copy":     ["copy"],
+}
+# inputs are the user's own files, and were always symlinked, so "auto" symlinks them rather than copy
+AUTO_INPUT_LINKS = ["reflink", "symlink"]
+_reflink_support: dict[int, bool] = {}
+
+def SupportsReflink(folder: str|Path) -> bool:
+    """whether files in [folder] can be reflinked, probed once per filesystem"""
+    dev = os.stat(folder).st_dev
+    known = _reflink_support.get(dev)
+    if known is not None: return known
+    probe = os.path.join(folder, f".limes_x-reflink-probe-{os.getpid()}")
+    ok = False
+    try:
+        with open(probe, 'wb') as f: f.write(b'.')
+        fin = os.open(probe, os.O_RDONLY)
+        fout = os.open(probe+".clone", os.O_WRONLY|os.O_CREAT|os.O_TRUNC)
+        ok = _reflink(fin, fout)
+        os.close(fin); os.close(fout)
+    except OSError:
+        pass
+    finally:
+        for p in [probe, probe+".clone"]:
+            if os.path.exists(p): os.remove(p)
+    _reflink_support[dev] = ok
+    return ok
+
+def _can_link(src: str, dst_folder: str, strategy: str):
+    if strategy in {"symlink", "copy"}: return True
+    if os.stat(src).st_dev != os.stat(dst_folder).st_dev: return False
+    return strategy == "hardlink" or SupportsReflink(dst_folder)
+
+def _link_file(src: str, dst: str, strategy: str):
+    if strategy == "symlink":
+        os.symlink(src, dst)
+    elif strategy == "hardlink":
+        os.link(src, dst)
+    else:
+        CopyFile(src, dst) # tries a reflink first
+
+def Link(src: str|Path, dst: str|Path, strategy: str|list[str]="auto") -> str:
+    """make [src] available at [dst] as cheaply as [strategy] allows, returns the strategy used
+    - symlink: points to the original, nothing is copied
+    - hardlink: same data, so a change to either is a change to both, same filesystem only
+    - reflink: an independent copy that shares data until modified, instant on btrfs, xfs, and the like
+    - copy: an independent copy
+    - auto: reflink if the filesystem supports it, otherwise hardlink, otherwise copy,
+    never a symlink, which would break when what it points to is moved or regenerated
+    - a strategy that isn't possible falls back to copy, or give a list to try in order
+    - folders are symlinked as a whole, otherwise each file in them is linked
+    """
+    src, dst = os.path.abspath(src), str(dst)
+    if os.path.lexists(dst): raise FileExistsError(f"[{dst}] already exists")
+    dst_folder = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(dst_folder, exist_ok=True)
+    strategies = _LINK_FALLBACKS[strategy] if isinstance(strategy, str) else strategy
+    for s in strategies:
+        if s not in LINK_STRATEGIES: raise ValueError(f"unknown link strategy [{s}]")
+        if not _can_link(src, dst_folder, s): continue
+        if os.path.isdir(src) and s != "symlink":
+            for root, _, files in os.walk(src, followlinks=True):
+                here = os.path.join(dst, os.path.relpath(root, src))
+                os.makedirs(here, exist_ok=True)
+                for f in files:
+                    _link_file(os.path.join(root, f), os.path.join(here, f), s)
+        else:
+            _link_file(src, dst, s)
+        return s
+    raise OSError(f"couldn't link [{src}] to [{dst}] with any of {strategies}")
+
+def WriteJson(path: str|Path, data: Any, **kwargs):
+    """write [data] as json so that [path] appears complete or not at all
+    - readers waiting on the path never see a partially written file
+    - the rename is the signal that the writer is done
+    """
+    path = Path(path)
+    tmp = path.parent.joinpath(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w') as j:
+        json.dump(data, j, **kwargs)
+    os.replace(tmp, path)
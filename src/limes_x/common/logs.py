@@ -0,0 +1,121 @@
+from __future__ import annotations
+import os
+import time
+import gzip
+import shutil
+from pathlib import Path
+from collections import deque
+from threading import Condition, Thread
+
+class RealtimeLog:
+    """buffered writer for a job's realtime.log
+    - the file is kept open and written in blocks when [flush_sec] passed or [flush_bytes] are buffered,
+    instead of an open/append/close per line, which is a metadata storm on network filesystems
+    - if [rotate_bytes] is set, full logs are gzipped to realtime.log.1.gz, .2.gz, ... keeping [keep_rotated]
+    - the last [tail_lines] lines of each stream are kept in memory for result.json
+    """
+    DEFAULT_TAIL_LINES = 5000
+
+    def __init__(self, path: Path,
+        flush_sec: float=1,
+        flush_bytes: int=1<<16,
+        rotate_bytes: int|None=None,
+        keep_rotated: int=5,
+        tail_lines: int|None=DEFAULT_TAIL_LINES,
+    ) -> None:
+        self.path = Path(path)
+        self._flush_sec = flush_sec
+        self._flush_bytes = flush_bytes
+        self._rotate_bytes = rotate_bytes
+        self._keep_rotated = keep_rotated
+        self._tail_lines = tail_lines
+
+        self._sync = Condition()
+        self._buffer: list[str] = []
+        self._buffered = 0
+        self._written = self.path.stat().st_size if self.path.exists() else 0
+        self._file = None
+        self._tails: dict[str, deque[str]] = {}
+        self._closed = False
+        self._flusher = Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def Write(self, line: str, stream: str|None=None):
+        """[line] is written without its line end, and added to the tail of [stream] if given"""
+        with self._sync:
+            if stream is not None:
+                self.Tail(stream).append(line)
+            self._buffer.append(line+'\n')
+            self._buffered += len(line)+1
+            if self._buffered >= self._flush_bytes or self._closed:
+                self._flush()
+
+    def Tail(self, stream: str) -> deque[str]:
+        tail = self._tails.get(stream)
+        if tail is None:
+            tail = deque(maxlen=self._tail_lines)
+            self._tails[stream] = tail
+        return tail
+
+    def Flush(self):
+        with self._sync:
+            self._flush()
+
+    def Close(self):
+        with self._sync:
+            if self._closed: return
+            self._closed = True
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._sync.notify_all()
+        self._flusher.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.Close()
+
+    def _flush_periodically(self):
+        with self._sync:
+            while not self._closed:
+                self._sync.wait(self._flush_sec)
+                self._flush()
+
+    def _flush(self):
+        if len(self._buffer) == 0: return
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        self._written += self._buffered
+        self._buffer.clear()
+        self._buffered = 0
+        if self._closed: # late writes
+            self._file.close()
+            self._file = None
+        elif self._rotate_bytes is not None and self._written >= self._rotate_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        assert self._file is not None
+        self._file.close()
+        self._file = None
+        rotated = lambda i: self.path.parent.joinpath(f"{self.path.name}.{i}.gz")
+        oldest = rotated(self._keep_rotated)
+        if oldest.exists(): os.remove(oldest)
+        for i in range(self._keep_rotated-1, 0, -1):
+            if rotated(i).exists(): os.rename(rotated(i), rotated(i+1))
+        with open(self.path, 'rb') as src, gzip.open(rotated(1), 'wb') as dst:
+            shutil.copyfileobj(src, dst, length=1<<20)
+        os.remove(self.path)
+        self._written = 0
+
+    @classmethod
+    def Remove(cls, path: Path):
+        path = Path(path)
+        if path.exists(): os.remove(path)
+        for rotated in path.parent.glob(f"{path.name}.*.gz"):
+            os.remove(rotated)
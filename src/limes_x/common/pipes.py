@@ -0,0 +1,135 @@
+from __future__ import annotations
+import os
+import selectors
+from threading import Thread, Lock
+from typing import IO, Callable
+
+class _Stream:
+    def __init__(self, io: IO[bytes], on_line: Callable[[str], None], on_close: Callable[[], None]|None, encoding: str) -> None:
+        self.io = io
+        self.fd = io.fileno()
+        self._on_line = on_line
+        self._on_close = on_close
+        self._encoding = encoding
+        self._buffer = b''
+
+    def _emit(self, line: str):
+        # a bad callback must not stop output handling for every other process
+        try:
+            self._on_line(line)
+        except Exception as e:
+            print(f"ERROR: in output callback: {e}")
+
+    def _emit_progress(self, text: str):
+        # \r is progress output that overwrites itself, each update is its own line
+        *progress, last = text.split('\r')
+        for p in progress: self._emit(p+'\r')
+        return last
+
+    def _decode(self, data: bytes):
+        return data.decode(self._encoding, errors='replace')
+
+    def Feed(self, chunk: bytes):
+        data = self._buffer + chunk
+        cut = data.rfind(b'\n')+1
+        rest = data[cut:]
+        if cut > 0:
+            # decode and split all complete lines at once, only lines with \r need more work
+            *lines, _ = self._decode(data[:cut]).split('\n')
+            on_line = self._on_line
+            for line in lines:
+                if '\r' in line:
+                    if line.endswith('\r'): line = line[:-1] # \r\n is a normal line end
+                    line = self._emit_progress(line)
+                try:
+                    on_line(line+'\n')
+                except Exception as e:
+                    print(f"ERROR: in output callback: {e}")
+
+        # progress updates without a newline yet, a trailing \r may be the first half of \r\n
+        last_cr = rest.rfind(b'\r', 0, len(rest)-1)
+        if last_cr >= 0:
+            self._emit_progress(self._decode(rest[:last_cr+1]))
+            rest = rest[last_cr+1:]
+        self._buffer = rest
+
+    def Close(self):
+        try:
+            rest = self._emit_progress(self._decode(self._buffer))
+            if len(rest) > 0: self._emit(rest)
+            self._buffer = b''
+            self.io.close()
+        except OSError:
+            pass
+        finally:
+            if self._on_close is not None: self._on_close()
+
+class IoMultiplexer:
+    """reads the output of many child processes from a single thread
+    - pipes are made non-blocking and polled with the platform's best selector (epoll on linux)
+    - reads are large and buffered, lines are split on \\n, and on \\r for progress bars
+    - callbacks are called from the multiplexer's thread, so they should be quick
+    """
+    CHUNK_SIZE = 1<<16
+    _shared: IoMultiplexer|None = None
+    _shared_lock = Lock()
+
+    def __init__(self) -> None:
+        self._selector = selectors.DefaultSelector()
+        self._lock = Lock()
+        self._pending: list[_Stream] = []
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._pid = os.getpid()
+        self._worker = Thread(target=self._loop, daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def Shared(cls) -> IoMultiplexer:
+        with cls._shared_lock:
+            # threads don't survive a fork
+            if cls._shared is None or cls._shared._pid != os.getpid():
+                cls._shared = IoMultiplexer()
+            return cls._shared
+
+    def Register(self, io: IO[bytes], on_line: Callable[[str], None], on_close: Callable[[], None]|None=None, encoding: str='utf-8'):
+        stream = _Stream(io, on_line, on_close, encoding)
+        os.set_blocking(stream.fd, False)
+        with self._lock:
+            self._pending.append(stream)
+        try:
+            os.write(self._wake_w, b'.')
+        except BlockingIOError:
+            pass # already awake
+
+    def _loop(self):
+        while True:
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    self._accept_pending()
+                    continue
+                stream: _Stream = key.data
+                try:
+                    chunk = os.read(stream.fd, self.CHUNK_SIZE)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    chunk = b''
+                if len(chunk) == 0:
+                    self._selector.unregister(stream.fd)
+                    stream.Close()
+                else:
+                    stream.Feed(chunk)
+
+    def _accept_pending(self):
+        try:
+            while len(os.read(self._wake_r, 1024)) > 0: pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+        for stream in pending:
+            self._selector.register(stream.fd, selectors.EVENT_READ, stream)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+from pathlib import Path
+from typing import Callable
+from contextlib import contextmanager
+
+from .utils import FileLock
+from .staging import Stager
+from .fs import Link
+
+class ReferenceCache:
+    """node local cache of reference databases and images, shared by all jobs on the node
+    - entries are versioned by the source's paths, sizes and mtimes, so a changed source is a new entry
+    - the first job to need an entry copies it in under a lock for that entry, others wait then reuse it
+    - jobs get hardlinks to files and symlinks to folders, and must treat them as read only
+    - least recently used entries that no live job is using are evicted to stay within [budget_bytes]
+    """
+    LOCK_TIMEOUT = 48*60*60 # populating can take as long as copying the largest reference
+
+    def __init__(self, root: str|Path, budget_bytes: int, workers: int=8, log: Callable[[str], None]|None=None) -> None:
+        self.root = Path(os.path.abspath(os.path.expandvars(root)))
+        self._entries = self.root.joinpath("entries")
+        os.makedirs(self._entries, exist_ok=True)
+        self.budget = budget_bytes
+        self._workers = workers
+        self._log = log if log is not None else lambda s: None
+        self._pid = os.getpid()
+        self.copied_bytes = 0
+        with self._index() as cur:
+            cur.execute("create table if not exists entries (key text primary key, source text, bytes int, last_used real)")
+            cur.execute("create table if not exists users (key text, pid int)")
+
+    @contextmanager
+    def _index(self):
+        con = sqlite3.connect(self.root.joinpath("index.db"), timeout=self.LOCK_TIMEOUT, isolation_level=None)
+        try:
+            cur = con.cursor()
+            cur.execute("begin immediate")
+            try:
+                yield cur
+                cur.execute("commit")
+            except:
+                cur.execute("rollback")
+                raise
+        finally:
+            con.close()
+
+    @classmethod
+    def Version(cls, src: Path) -> tuple[str, int]:
+        """key for the current content of [src] and its size in bytes"""
+        h = hashlib.sha1(str(os.path.realpath(src)).encode())
+        total = 0
+        if src.is_dir():
+            for folder, dirs, files in os.walk(src, followlinks=True):
+                dirs.sort()
+                for f in sorted(files):
+                    p = os.path.join(folder, f)
+                    st = os.stat(p)
+                    total += st.st_size
+                    h.update(f"{os.path.relpath(p, src)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+        else:
+            st = os.stat(src)
+            total = st.st_size
+            h.update(f":{st.st_size}:{st.st_mtime_ns}".encode())
+        return f"{src.name}-{h.hexdigest()[:16]}", total
+
+    def Get(self, src: Path) -> Path|None:
+        """path to a ready copy of [src] in the cache, copying it in if needed,
+        None if it can't fit in the budget"""
+        key, size = self.Version(src)
+        if size > self.budget: return None
+        entry = self._entries.joinpath(key)
+        with FileLock(self._entries.joinpath(key), timeout=self.LOCK_TIMEOUT):
+            with self._index() as cur:
+                cur.execute("insert into users values (?, ?)", (key, self._pid))
+                known = cur.execute("select 1 from entries where key=?", (key,)).fetchone() is not None
+            if known and entry.exists():
+                self._log(f"reference cache hit: {src.name}")
+            else:
+                if not self._reserve(key, src, size):
+                    with self._index() as cur:
+                        cur.execute("delete from users where key=? and pid=?", (key, self._pid))
+                    return None
+                try:
+                    self._populate(src, entry)
+                except:
+                    with self._index() as cur:
+                        cur.execute("delete from entries where key=?", (key,))
+                        cur.execute("delete from users where key=? and pid=?", (key, self._pid))
+                    raise
+        with self._index() as cur:
+            cur.execute("update entries set last_used=? where key=?", (time.time(), key))
+        return entry.joinpath(src.name)
+
+    def _populate(self, src: Path, entry: Path):
+        partial = entry.parent.joinpath(f"{entry.name}.partial")
+        if partial.exists(): shutil.rmtree(partial)
+        if entry.exists(): shutil.rmtree(entry)
+        os.makedirs(partial)
+        self._log(f"reference cache miss, copying in: {src}")
+        stager = Stager(workers=self._workers, log=self._log)
+        stager.Stage(src, partial.joinpath(src.name))
+        report = stager.Wait()
+        stager.Shutdown()
+        if len(report.errors) > 0:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise OSError(f"failed to cache [{src}]: {report.errors[0]}")
+        self.copied_bytes += report.bytes
+        os.rename(partial, entry)
+
+    def _is_in_use(self, cur: sqlite3.Cursor, key: str):
+        alive = False
+        for pid, in cur.execute("select pid from users where key=?", (key,)).fetchall():
+            if pid != self._pid and not os.path.exists(f"/proc/{pid}"):
+                cur.execute("delete from users where key=? and pid=?", (key, pid))
+            else:
+                alive = True
+        return alive
+
+    def _reserve(self, key: str, src: Path, size: int):
+        # evict until the new entry fits, then count it against the budget while it is copied in
+        with self._index() as cur:
+            cur.execute("delete from entries where key=?", (key,))
+            used, = cur.execute("select coalesce(sum(bytes), 0) from entries").fetchone()
+            for other, nbytes in cur.execute("select key, bytes from entries order by last_used").fetchall():
+                if used + size <= self.budget: break
+                if self._is_in_use(cur, other): continue
+                self._log(f"reference cache evicting: {other}")
+                shutil.rmtree(self._entries.joinpath(other), ignore_errors=True)
+                cur.execute("delete from entries where key=?", (other,))
+                used -= nbytes
+            if used + size > self.budget: return False
+            cur.execute("insert into entries values (?, ?, ?, ?)", (key, str(src), size, time.time()))
+            return True
+
+    def Link(self, cached: Path, dst: Path):
+        """make the cached copy available at [dst] without copying"""
+        # hardlinked files survive eviction of the entry
+        Link(cached, dst, "symlink" if cached.is_dir() else ["hardlink", "symlink"])
+
+    def Release(self):
+        """this process no longer needs its entries"""
+        with self._index() as cur:
+            cur.execute("delete from users where pid=?", (self._pid,))
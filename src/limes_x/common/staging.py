@@ -0,0 +1,165 @@
+from __future__ import annotations
+import os
+import time
+import subprocess
+from pathlib import Path
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable
+
+from .fs import CopyFile, CopyFileRange, TreeSize
+
+class StagingReport:
+    def __init__(self) -> None:
+        self.files = 0
+        self.bytes = 0
+        self.moved_files = 0
+        self.moved_bytes = 0
+        self.errors: list[str] = []
+        self.seconds = 0.0
+
+    def ToDict(self):
+        return {
+            "files": self.files,
+            "bytes": self.bytes,
+            "moved_files": self.moved_files,
+            "moved_bytes": self.moved_bytes,
+            "errors": self.errors,
+            "seconds": self.seconds,
+            "mb_per_sec": self.bytes/(1<<20)/self.seconds if self.seconds > 0 else 0,
+        }
+
+class Stager:
+    """copies files and folders to and from a node's local disk with a bounded pool of threads
+    - symlinks are followed, like cp -L
+    - with [tar_folders], folders are streamed through a tar pipe instead of copied file by file,
+    which is faster for many small files on network filesystems, Stage can also choose per folder
+    - with [move], sources on the same filesystem as their destination are renamed instead of copied
+    - files larger than [chunk_bytes] are copied as several chunks in parallel
+    - Stage queues work and returns immediately, Wait blocks until everything queued is done
+    """
+    def __init__(self, workers: int=8, tar_folders: bool=False, move: bool=False, chunk_bytes: int=1<<28, log: Callable[[str], None]|None=None) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._tar_folders = tar_folders
+        self._move = move
+        self._chunk_bytes = chunk_bytes
+        self._log = log if log is not None else lambda s: None
+        self._lock = Lock()
+        self._pending: list[Future] = []
+        self._report = StagingReport()
+        self._start: float|None = None
+
+    def Stage(self, src: str|Path, dst: str|Path, tar: bool|None=None):
+        """copy [src] to [dst], which is the full destination path, not the folder to put it in,
+        a folder goes through a tar pipe if [tar], or by default if the stager was made with tar_folders
+        """
+        if self._start is None: self._start = time.time()
+        src, dst = Path(src), Path(dst)
+        if not src.exists():
+            with self._lock:
+                self._report.errors.append(f"missing [{src}]")
+            return
+        os.makedirs(dst.parent, exist_ok=True)
+        if self._move and self._try_move(src, dst):
+            return
+        if not src.is_dir():
+            self._submit(self._copy, src, dst)
+        elif tar if tar is not None else self._tar_folders:
+            self._submit(self._tar, src, dst)
+        else:
+            for folder, _, files in os.walk(src, followlinks=True):
+                here = dst.joinpath(os.path.relpath(folder, src))
+                os.makedirs(here, exist_ok=True)
+                for f in files:
+                    self._submit(self._copy, Path(folder).joinpath(f), here.joinpath(f))
+
+    def _try_move(self, src: Path, dst: Path):
+        if os.path.islink(src) or os.lstat(src).st_dev != os.stat(dst.parent).st_dev: return False
+        if os.path.lexists(dst): return False
+        size = TreeSize(src, follow_symlinks=False)
+        try:
+            os.rename(src, dst)
+        except OSError:
+            return False
+        with self._lock:
+            self._report.moved_files += 1
+            self._report.moved_bytes += size
+        return True
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            self._pending.append(self._pool.submit(self._guard, fn, *args))
+
+    def _guard(self, fn, src: Path, dst: Path):
+        try:
+            fn(src, dst)
+        except Exception as e:
+            with self._lock:
+                self._report.errors.append(f"[{src}]: {e}")
+
+    def _copy(self, src: Path, dst: Path):
+        st = os.stat(src)
+        if st.st_size > self._chunk_bytes:
+            self._copy_chunked(src, dst, st)
+            return
+        size = CopyFile(src, dst)
+        with self._lock:
+            self._report.files += 1
+            self._report.bytes += size
+
+    def _copy_chunked(self, src: Path, dst: Path, st: os.stat_result):
+        with open(dst, 'wb') as f:
+            f.truncate(st.st_size)
+        chunks = [(o, min(self._chunk_bytes, st.st_size-o)) for o in range(0, st.st_size, self._chunk_bytes)]
+        remaining = [len(chunks)]
+        def _chunk(offset: int, length: int):
+            n = CopyFileRange(src, dst, offset, length)
+            with self._lock:
+                self._report.bytes += n
+                remaining[0] -= 1
+                done = remaining[0] == 0
+                if done: self._report.files += 1
+            if done:
+                os.chmod(dst, st.st_mode & 0o7777)
+                os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+        for offset, length in chunks:
+            self._submit(lambda s, d, o=offset, l=length: _chunk(o, l), src, dst)
+
+    def _tar(self, src: Path, dst: Path):
+        os.makedirs(dst, exist_ok=True)
+        # one process per side so that reading and writing overlap
+        reader = subprocess.Popen(["tar", "-chf", "-", "-C", str(src), "."], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        writer = subprocess.run(["tar", "-xf", "-", "-C", str(dst)], stdin=reader.stdout, capture_output=True)
+        if reader.stdout is not None: reader.stdout.close()
+        _, err = reader.communicate()
+        if reader.returncode != 0 or writer.returncode != 0:
+            raise OSError(f"tar pipe failed: {err.decode(errors='replace')}{writer.stderr.decode(errors='replace')}".strip())
+        files, size = 0, 0
+        for folder, _, names in os.walk(dst):
+            for f in names:
+                files += 1
+                size += os.path.getsize(os.path.join(folder, f))
+        with self._lock:
+            self._report.files += files
+            self._report.bytes += size
+
+    def Wait(self) -> StagingReport:
+        """wait for everything staged so far, returns the report since the last Wait"""
+        while True:
+            with self._lock:
+                pending = self._pending
+                self._pending = []
+            if len(pending) == 0: break
+            for f in pending: f.result()
+        with self._lock:
+            report = self._report
+            report.seconds = time.time()-self._start if self._start is not None else 0
+            self._report = StagingReport()
+            self._start = None
+        self._log(f"staged {report.files} files, {report.bytes/(1<<20):.1f} MB in {report.seconds:.2f}s"
+            + (f", moved {report.moved_files}" if report.moved_files > 0 else ""))
+        for e in report.errors: self._log(f"ERROR: {e}")
+        return report
+
+    def Shutdown(self):
+        self._pool.shutdown(wait=True)
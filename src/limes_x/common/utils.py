@@ -1,12 +1,6 @@
 import os
 import uuid
-from typing import IO, Callable
-from inspect import signature
-import subprocess
-from threading import Condition, Thread
-from queue import Queue
-import random
-import sqlite3
+from typing import Any, Callable
 from datetime import datetime as dt
 
 def RemoveTrailingSlash(path: str):
@@ -36,13 +30,11 @@ def CurrentTimeMillis():
 def Timestamp():
     return f"{dt.now().strftime('%H:%M:%S')}>"
 
-def LiveShell(cmd: str, onOut: Callable[[str], None]|None=None, onErr: Callable[[str], None]|None=None, echo_cmd: bool=True):
-    class _Pipe:
-        def __init__(self, io:IO[bytes]|None, lock: Condition=Condition(), q: Queue=Queue()) -> None:
-            assert io is not None
-            self.IO = io
-            self.Lock = lock
-            self.Q = q
+def LiveShell(cmd: str, onOut: Callable[[str], None]|None=None, onErr: Callable[[str], None]|None=None, echo_cmd: bool=True,
+    onStart: Callable[[Any], None]|None=None, new_session: bool=False):
+    import subprocess
+    from threading import Condition
+    from .pipes import IoMultiplexer
 
     def callback(cb, msg):
         if cb is None:
@@ -50,41 +42,34 @@ def LiveShell(cmd: str, onOut: Callable[[str], None]|None=None, onErr: Callable[
         else:
             cb(msg)
 
-    ENCODING = 'utf-8'
     process = subprocess.Popen(
         cmd,
         shell=True,
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
+        start_new_session=new_session, # so the whole process group can be killed
     )
+    if onStart is not None: onStart(process)
 
     if echo_cmd: callback(onOut, f'{cmd}\n')
-    _in, _out, _err = [_Pipe(io) for io in [process.stdin, process.stdout, process.stderr]]
-    _process = process
-
-    workers: list[Thread] = []
-    def reader(pipe: _Pipe, cb: Callable[[str], None]|None):
-        io = iter(pipe.IO.readline, b'')
-        while True:
-            try:
-                line = next(io)
-            except (StopIteration, ValueError) as e:
-                # print(f'err:{type(e)} {e.args}|')
-                break
-            chunk = bytes.decode(line, encoding=ENCODING)
-            callback(cb, chunk)
-    workers.append(Thread(target=reader, args=[_out, onOut]))
-    workers.append(Thread(target=reader, args=[_err, onErr]))
-        
-    for w in workers:
-        w.daemon = True # stop with program
-        w.start()
-
-    _process.wait()
-    code = _process.poll()
-    for w in workers:
-        w.join()
+    assert process.stdout is not None and process.stderr is not None
+
+    # output of every process is read by one shared thread
+    open_streams = [2]
+    closed = Condition()
+    def on_close():
+        with closed:
+            open_streams[0] -= 1
+            closed.notify_all()
+    mux = IoMultiplexer.Shared()
+    mux.Register(process.stdout, lambda s: callback(onOut, s), on_close)
+    mux.Register(process.stderr, lambda s: callback(onErr, s), on_close)
+
+    process.wait()
+    code = process.poll()
+    with closed:
+        closed.wait_for(lambda: open_streams[0] == 0)
     if code is None: code = 1
     return code
 
@@ -121,6 +106,7 @@ class FileLock(object):
             exceeds `timeout` number of seconds, in which case it throws 
             an exception.
         """
+        import sqlite3, random
         start_time = time.time()
         max_delay = self.timeout
         base_delay = 0.1
@@ -208,6 +194,7 @@ class Overloader:
         return cls
 
     def Overload(self, fn) -> Callable:
+        from inspect import signature
         def _later(all_overloads: dict):
             fn_name = fn.__name__
             fn_overloads = all_overloads.get(fn_name, [])
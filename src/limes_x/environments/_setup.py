@@ -1,7 +1,17 @@
-from re import VERBOSE
 import sys, os
+import time
 from pathlib import Path
-from dataclasses import dataclass
+
+class ExecutionEssentials:
+    # a plain class, dataclasses alone would add several milliseconds to every job's startup
+    def __init__(self, module_path: Path, module, workspace: Path, relative_output_path: Path, context, verbose: bool, timings: dict[str, float]) -> None:
+        self.module_path = module_path
+        self.module = module
+        self.workspace = workspace
+        self.relative_output_path = relative_output_path
+        self.context = context
+        self.verbose = verbose
+        self.timings = timings
 
 def ParseArgs(python_path: list[str]|None=None):
     if python_path is not None:
@@ -11,24 +21,21 @@ def ParseArgs(python_path: list[str]|None=None):
     assert len(_paths) == 3, f"bad receive {_paths}"
     MODULE_PATH, WORKSPACE, RELATIVE_OUTPUT_PATH = [Path(p) for p in _paths[:3]]
 
+    _t = time.time()
     from limes_x.execution.modules import ComputeModule, JobContext
     # from limes_x.telemetry import ResourceMonitor
+    timings = {"import": time.time()-_t}
 
     _here = os.getcwd()
     os.chdir(WORKSPACE) # to keep relative output path
+    _t = time.time()
     CONTEXT = JobContext.LoadFromDisk(RELATIVE_OUTPUT_PATH)
+    timings["load_context"] = time.time()-_t
+    _t = time.time()
     THIS_MODULE = ComputeModule._load(MODULE_PATH)
+    timings["load_module"] = time.time()-_t
     os.chdir(_here)
 
-    @dataclass
-    class ExecutionEssentials:
-        module_path: Path
-        module: ComputeModule
-        workspace: Path
-        relative_output_path: Path
-        context: JobContext
-        verbose: bool
-        
     return ExecutionEssentials(
         module_path=MODULE_PATH,
         module=THIS_MODULE,
@@ -36,4 +43,5 @@ def ParseArgs(python_path: list[str]|None=None):
         relative_output_path=RELATIVE_OUTPUT_PATH,
         context=CONTEXT,
         verbose=VERBOSE,
-    )
\ No newline at end of file
+        timings=timings,
+    )
@@ -5,10 +5,17 @@ import time
 import uuid
 from datetime import datetime as dt
 import random
+import fcntl
+import tempfile
+import subprocess
+import signal
+from threading import Event, Timer
 
 if __name__ == '__main__':
-    NEWLINE = '\n'
+    START = time.time()
 
+    REF_CACHE_GB = sys.argv.pop()
+    REF_CACHE = sys.argv.pop()
     TMP_NAME = sys.argv.pop()
     TMP = Path(os.environ.get(TMP_NAME, '/tmp'))
     LIB = sys.argv.pop()
@@ -20,9 +27,22 @@ if __name__ == '__main__':
     HPC_LIB = HPC_SPACE.joinpath('lib'); os.makedirs(HPC_WS)
     HPC_REF = HPC_SPACE.joinpath('ref'); os.makedirs(HPC_REF)
     os.chdir(HPC_WS)
-    os.system(f'mkdir -p {HPC_LIB} && tar -hxf {LIB} -C {HPC_LIB}')
 
-    sys.path = list(set([str(HPC_LIB)]+sys.path))
+    # limes_x is extracted once per node for each version of the bundle, and shared by all jobs
+    SRC_ROOT = Path(os.path.expandvars(REF_CACHE)) if REF_CACHE != "" else Path(tempfile.gettempdir()).joinpath(f'limes_x-{os.getuid()}')
+    NODE_SRC = SRC_ROOT.joinpath('src').joinpath(Path(LIB).name.split('.')[0])
+    if not NODE_SRC.exists():
+        os.makedirs(NODE_SRC.parent, exist_ok=True)
+        with open(NODE_SRC.parent.joinpath(f'{NODE_SRC.name}.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not NODE_SRC.exists():
+                partial = NODE_SRC.parent.joinpath(f'{NODE_SRC.name}.{uuid.uuid4().hex}.partial')
+                os.makedirs(partial)
+                subprocess.run(['tar', '-hxf', LIB, '-C', partial], check=True)
+                os.rename(partial, NODE_SRC)
+    timings = {"start": START, "extract_src": time.time()-START}
+
+    sys.path = list(set([str(NODE_SRC), str(HPC_LIB)]+sys.path))
     from _setup import ParseArgs
     e = ParseArgs(sys.path)
     MODULE_PATH, WORKSPACE, RELATIVE_OUTPUT_PATH, CONTEXT, THIS_MODULE, VERBOSE = e.module_path, e.workspace, e.relative_output_path, e.context, e.module, e.verbose
@@ -30,24 +50,28 @@ if __name__ == '__main__':
 
     import limes_x.environments.local as env
     from limes_x.execution.modules import ComputeModule
-    from limes_x.execution.comms import FileSyncedDictionary
+    from limes_x.execution.executors import Job
+    from limes_x.execution.comms import IoSemaphore
     from limes_x.common.utils import LiveShell
+    from limes_x.common.logs import RealtimeLog
+    from limes_x.common.fs import WriteJson, IsNetworkFileSystem
+    from limes_x.common.staging import Stager
+    from limes_x.common.refcache import ReferenceCache
 
     cmd_history = []
-    err_log, out_log = [], []
-    realtime_log = WORKSPACE.joinpath(RELATIVE_OUTPUT_PATH).joinpath('realtime.log')
+    OUT, ERR = 'out', 'err'
+    realtime_log = RealtimeLog(WORKSPACE.joinpath(RELATIVE_OUTPUT_PATH).joinpath('realtime.log'))
 
     def _timestamp():
         return f"{dt.now().strftime('%H:%M:%S')}>"
 
-    def _on_io(s: str, log: list, is_child: bool):
+    def _on_io(s: str, stream: str, is_child: bool):
+        if is_child: return
         if s.endswith('\n'): s = s[:-1]
         line = f'{_timestamp()} {s}'
-        if not is_child: log.append(line)
-        with open(realtime_log, 'a') as f:
-            if not is_child: f.write(line+NEWLINE)
+        realtime_log.Write(line, stream)
 
-    def _shell(cmd: str, is_child: bool):
+    def _shell(cmd: str, is_child: bool, timeout: float|None=None):
         cmd = cmd.replace("  ", "")
         lines = cmd.split('\n')
         ts = _timestamp()
@@ -57,87 +81,137 @@ if __name__ == '__main__':
             if line == "": continue
             cmd_history.append(f"{' '*(len(ts))}{line}")
 
+        # after [timeout], the command is killed along with everything it started, returns whether it was
+        expired = Event()
+        timers: list[Timer] = []
+        def _on_start(process: subprocess.Popen):
+            if timeout is None: return
+            def _kill():
+                expired.set()
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            timer = Timer(timeout, _kill)
+            timer.daemon = True
+            timer.start()
+            timers.append(timer)
         LiveShell(
             cmd, echo_cmd=False,
-            onOut=lambda s: _on_io(s, out_log, is_child),
-            onErr=lambda s: _on_io(s, err_log, is_child),
+            onOut=lambda s: _on_io(s, OUT, is_child),
+            onErr=lambda s: _on_io(s, ERR, is_child),
+            onStart=_on_start, new_session=timeout is not None,
         )
+        for t in timers: t.cancel()
+        return expired.is_set()
+
+    def _log(msg: str):
+        realtime_log.Write(f'{_timestamp()} {msg}', OUT)
 
-    # get inputs
+    # stage inputs, module src, and requirements concurrently
+    _t = time.time()
+    stager = Stager(workers=max(4, 2*CONTEXT.params.threads), log=_log)
+    # input folders are often many small files, which a tar pipe reads much faster from a network filesystem
+    tar_inputs = IsNetworkFileSystem(WORKSPACE)
     for item, ps in CONTEXT.manifest.items():
         if not isinstance(ps, list): ps = [ps]
         for p in ps:
             if not isinstance(p, Path): continue
-            toks = str(p).split('/')
-            folder = '/'.join(toks[:-1])
-            if not os.path.exists(folder): os.makedirs(folder, exist_ok=True)
-            _shell(f"""\
-                echo "---- getting input: {p}"
-                cp -r -L {WORKSPACE.joinpath(p)} {folder}/
-            """, is_child=False)
-    _shell('''\
-        echo "---- starting workspace:"
-        ls | xargs -I {} sh -c "echo {}/ && ls -lh {}"
-    ''', is_child=False)
-
-    # get module src
+            _log(f"---- getting input: {p}")
+            stager.Stage(WORKSPACE.joinpath(p), HPC_WS.joinpath(p), tar=tar_inputs)
+
     lib_name = env.__name__
     module_name = str(MODULE_PATH).split('/')[-1]
-    _shell(f"""\
-        echo "---- getting module src"
-        mkdir -p {HPC_LIB}/{module_name}
-        cp -r -L {MODULE_PATH}/{ComputeModule.LIB_FOLDER} {HPC_LIB}/{module_name}
-        cd {HPC_WS} && ls -lh
-    """, is_child=False)
-    _shell(f"ls -lh {HPC_LIB}", is_child=False)
-
-    # get requirements
-    requirements = [str(CONTEXT.params.reference_folder.joinpath(req)) for req in THIS_MODULE.requirements]
-    req_ok = False
-    for req in requirements:
-        if not os.path.exists(req):
-            req_ok = False
-            _shell(f'!ERR: requirement [{req}] missing"', is_child=False)
-            break
-        _shell(f"""\
-            echo "---- getting requirement: {req}"
-            cp -r {req} {HPC_REF}
-        """, is_child=False)
-    _shell(f"ls -lh {HPC_REF}", is_child=False)
-    CONTEXT.params.reference_folder = HPC_REF
-    CONTEXT.ref = HPC_LIB
-    CONTEXT.Save(HPC_WS)
-
-    # remove myself from list of io jobs
-    with FileSyncedDictionary(WORKSPACE) as com:
-        com.RemoveIoTask(CONTEXT.job_id)
-
-    # run step if @req met
-    if req_ok:
-        _shell("echo $(date) running...", is_child=False)
-        _shell(f"""\
-            python {env.__file__} {HPC_LIB}/{module_name} {HPC_WS} {RELATIVE_OUTPUT_PATH} {True}\
-        """, is_child=True)
+    _log("---- getting module src")
+    stager.Stage(MODULE_PATH.joinpath(ComputeModule.LIB_FOLDER), HPC_LIB.joinpath(module_name).joinpath(ComputeModule.LIB_FOLDER))
+
+    req_ok = True
+    timed_out = False
+    ref_cache = None
+    if REF_CACHE != "":
+        ref_cache = ReferenceCache(REF_CACHE, int(float(REF_CACHE_GB)*(1<<30)), log=_log)
+    # leases on cached requirements keep them from being evicted while in use, release them even if the job fails
+    try:
+        for req in THIS_MODULE.requirements:
+            src = CONTEXT.params.reference_folder.joinpath(req)
+            if not src.exists():
+                req_ok = False
+                _log(f'!ERR: requirement [{src}] missing')
+                break
+            _log(f"---- getting requirement: {src}")
+            cached = None
+            if ref_cache is not None:
+                try:
+                    cached = ref_cache.Get(src)
+                except OSError as e:
+                    _log(f"ERROR: reference cache: {e}")
+            if cached is not None:
+                ref_cache.Link(cached, HPC_REF.joinpath(req))
+            else:
+                stager.Stage(src, HPC_REF.joinpath(req))
+
+        staging = stager.Wait()
+        if ref_cache is not None: staging.bytes += ref_cache.copied_bytes
+        stager.Shutdown()
+        if len(staging.errors) > 0: req_ok = False
+        CONTEXT.params.reference_folder = HPC_REF
+        CONTEXT.ref = HPC_LIB
+        CONTEXT.Save(HPC_WS)
+        timings["stage"] = time.time()-_t
+
+        # remove myself from list of io jobs, reporting how fast staging went
+        IoSemaphore(WORKSPACE).Release(CONTEXT.job_id, staged_bytes=staging.bytes, staged_sec=staging.seconds)
+
+        # run step if @req met
+        if req_ok:
+            _shell("echo $(date) running...", is_child=False)
+            _t = time.time()
+            # the time limit starts here, time spent queued by the scheduler or staging doesn't count
+            timed_out = _shell(f"""\
+                python {env.__file__} {HPC_LIB}/{module_name} {HPC_WS} {RELATIVE_OUTPUT_PATH} {True}\
+            """, is_child=True, timeout=CONTEXT.params.timeout_sec)
+            timings["run"] = time.time()-_t
+            if timed_out: _log(f"!ERR: {Job.TIMEOUT_MESSAGE.format(CONTEXT.params.timeout_sec)}")
+    finally:
+        if ref_cache is not None: ref_cache.Release()
 
-        # gather results
+    if req_ok:
+        # gather results, only what the manifest promised if successful, everything otherwise
         BL = {
             'context.json',
             'result.json',
             'realtime.log'
         }
-        LOCAL_OUT_PATH = Path(WORKSPACE).joinpath(RELATIVE_OUTPUT_PATH)
-        for out in os.listdir(RELATIVE_OUTPUT_PATH):
-            if out in BL: continue
-            _shell(f"""\
-                echo "---- copying back result: {out}"
-                cd {RELATIVE_OUTPUT_PATH}
-                cp -r {out} {LOCAL_OUT_PATH.joinpath(out)}
-            """, is_child=False)
-        _shell("""\
-            echo "---- final workspace:"
-            ls | xargs -I {} sh -c "echo {}/ && ls -lh {}"
-            echo "---- done!"
-        """, is_child=False)
+        _t = time.time()
+        _log("---- copying back results")
+        wanted: list[Path] = []
+        try:
+            with open(RELATIVE_OUTPUT_PATH.joinpath('result.json')) as j:
+                child_res = json.load(j)
+        except (OSError, json.JSONDecodeError):
+            child_res = {}
+        manifest = child_res.get('manifest')
+        if child_res.get('error_message') is None and isinstance(manifest, dict):
+            for ps in manifest.get('paths', {}).values():
+                for p in ps:
+                    p = Path(p)
+                    if p.is_absolute() or not p.is_relative_to(RELATIVE_OUTPUT_PATH): continue # not made here
+                    wanted.append(p)
+            for out in os.listdir(RELATIVE_OUTPUT_PATH):
+                if out in BL: continue
+                if out.endswith('.log') or '.log.' in out: wanted.append(RELATIVE_OUTPUT_PATH.joinpath(out))
+        else:
+            wanted = [RELATIVE_OUTPUT_PATH.joinpath(out) for out in os.listdir(RELATIVE_OUTPUT_PATH) if out not in BL]
+        wanted = sorted(set(wanted))
+        wanted = [p for i, p in enumerate(wanted) if not any(p.is_relative_to(q) for q in wanted[:i])] # parents cover children
+
+        copier = Stager(workers=max(4, 2*CONTEXT.params.threads), move=True, log=_log)
+        for p in wanted:
+            copier.Stage(HPC_WS.joinpath(p), WORKSPACE.joinpath(p))
+        copy_back = copier.Wait()
+        copier.Shutdown()
+        _log("---- done!")
+        timings["copy_back"] = time.time()-_t
 
     result_json = 'result.json'
     result_path = RELATIVE_OUTPUT_PATH.joinpath(result_json)
@@ -152,8 +226,14 @@ if __name__ == '__main__':
             return {}
 
     res = _get_result_json()
+    if timed_out:
+        res['error_message'] = Job.TIMEOUT_MESSAGE.format(CONTEXT.params.timeout_sec)
+        res['timed_out'] = True
     res['hpc-wrapper_commands'] = cmd_history
-    res['hpc-wrapper_out'] = out_log
-    res['hpc-wrapper_err'] = err_log
-    with open(WORKSPACE.joinpath(RELATIVE_OUTPUT_PATH).joinpath(result_json), 'w') as outj:
-        json.dump(res, outj, indent=4)
+    realtime_log.Close()
+    res['hpc-wrapper_out'] = list(realtime_log.Tail(OUT))
+    res['hpc-wrapper_err'] = list(realtime_log.Tail(ERR))
+    res['hpc-wrapper_timings'] = timings
+    res['hpc-wrapper_staging'] = staging.ToDict()
+    if req_ok: res['hpc-wrapper_copy_back'] = copy_back.ToDict()
+    WriteJson(WORKSPACE.joinpath(RELATIVE_OUTPUT_PATH).joinpath(result_json), res, indent=4)
@@ -1,30 +1,28 @@
 import sys, os
+import time
 from pathlib import Path
-import json
 from datetime import datetime as dt
+from typing import Any
 
-if __name__ == '__main__':
-    SRC = os.path.abspath(Path(__file__).joinpath('../../..'))
-    sys.path = list(set([SRC]+sys.path))
-    from _setup import ParseArgs
-    e = ParseArgs()
-    MODULE_PATH, WORKSPACE, RELATIVE_OUTPUT_PATH, CONTEXT, THIS_MODULE, VERBOSE = e.module_path, e.workspace, e.relative_output_path, e.context, e.module, e.verbose
+def Execute(THIS_MODULE, CONTEXT, WORKSPACE: Path, RELATIVE_OUTPUT_PATH: Path, VERBOSE: bool, timings: dict[str, float]):
+    # runs the procedure of a loaded module in this process and writes result.json
     from limes_x.common.utils import LiveShell
+    from limes_x.common.logs import RealtimeLog
+    from limes_x.common.fs import WriteJson
     from limes_x.execution.modules import JobResult
 
     cmd_history = []
-    err_log, out_log = [], []
-    realtime_log = WORKSPACE.joinpath(RELATIVE_OUTPUT_PATH).joinpath('realtime.log')
-    def _on_io(s: str, log: list):
+    OUT, ERR = 'out', 'err'
+    realtime_log = RealtimeLog(WORKSPACE.joinpath(RELATIVE_OUTPUT_PATH).joinpath('realtime.log'))
+    def _on_io(s: str, stream: str):
         timestamp = f"{dt.now().strftime('%H:%M:%S')}>"
         if s.endswith('\n'): s = s[:-1]
         line = f'{timestamp} {s}'
         if not s.endswith('\r'):
-            log.append(line)
+            realtime_log.Write(line, stream)
         else:
             line = line[:-1]
-        with open(realtime_log, 'a') as f:
-            f.write(line+'\n')
+            realtime_log.Write(line)
         if VERBOSE: print(line)
     def _shell(cmd: str):
         lines = cmd.split('\n')
@@ -38,24 +36,30 @@ if __name__ == '__main__':
 
         code = LiveShell(
             cmd, echo_cmd=False,
-            onOut=lambda s: _on_io(s, out_log),
-            onErr=lambda s: _on_io(s, err_log),
+            onOut=lambda s: _on_io(s, OUT),
+            onErr=lambda s: _on_io(s, ERR),
         )
         return code
 
     CONTEXT.shell = _shell
     CONTEXT.output_folder = RELATIVE_OUTPUT_PATH
 
+    _here, _sys_path = os.getcwd(), sys.path
     os.chdir(WORKSPACE)
     # monitor = ResourceMonitor(relative_output_path)
     result = None
     err = ""
+    _t = time.time()
     try:
         sys.path = list(set([str(CONTEXT.ref)] + sys.path))
         result = THIS_MODULE._procedure(CONTEXT)
+    except MemoryError as e:
+        err = f"out of memory: {e}" # so that RetryPolicy can tell
     except Exception as e:
         err = str(e)
     finally:
+        timings["procedure"] = time.time()-_t
+        sys.path = _sys_path
         # res_log = monitor.Stop()
         if result is None:
             result = JobResult()
@@ -64,8 +68,6 @@ if __name__ == '__main__':
     # result.resource_log = res_log
     result.resource_log = []
     result.commands = cmd_history
-    result.out_log = out_log
-    result.err_log = err_log
 
     def _rectify_if_path(v):
         if isinstance(v, Path) and os.path.isabs(v):
@@ -77,6 +79,7 @@ if __name__ == '__main__':
         else:
             return v
 
+    _t = time.time()
     if result.manifest is not None:
         for k, val in list(result.manifest.items()):
             if isinstance(val, list):
@@ -99,8 +102,60 @@ if __name__ == '__main__':
             result.error_message = f'result manifest corrupted'
     else:
         result.error_message = f'no manifest'
+    timings["check_manifest"] = time.time()-_t
+    result.timings = timings
+    realtime_log.Close()
+    result.out_log = list(realtime_log.Tail(OUT))
+    result.err_log = list(realtime_log.Tail(ERR))
 
     result_path = RELATIVE_OUTPUT_PATH.joinpath('result.json')
-    with open(result_path, 'w') as j:
-        d = result.ToDict()
-        json.dump(d, j, indent=4)
+    WriteJson(result_path, result.ToDict(), indent=4)
+    os.chdir(_here)
+    return result
+
+# loaded modules of a pooled worker, key is module location
+_loaded_modules: dict[str, tuple[float, Any]] = {}
+
+def WarmWorker():
+    # pay for the imports once per worker, instead of once per job
+    import limes_x.execution.modules
+    import limes_x.common.utils
+
+def RunInWorker(module_path: str, workspace: str, relative_output_path: str, verbose: bool):
+    # same contract as running this file, but in an already warm process
+    START = time.time()
+    from limes_x.execution.modules import ComputeModule, JobContext
+    WORKSPACE, RELATIVE_OUTPUT_PATH = Path(workspace), Path(relative_output_path)
+
+    timings = {"start": START}
+    _here = os.getcwd()
+    os.chdir(WORKSPACE)
+    try:
+        _t = time.time()
+        CONTEXT = JobContext.LoadFromDisk(RELATIVE_OUTPUT_PATH)
+        timings["load_context"] = time.time()-_t
+
+        _t = time.time()
+        definition = Path(module_path).joinpath(ComputeModule.LIB_FOLDER).joinpath(ComputeModule.DEFINITION_FILE_NAME)
+        mtime = os.path.getmtime(definition)
+        cached = _loaded_modules.get(module_path)
+        if cached is None or cached[0] != mtime:
+            cached = mtime, ComputeModule._load(module_path)
+            _loaded_modules[module_path] = cached
+        THIS_MODULE = cached[1]
+        timings["load_module"] = time.time()-_t
+    finally:
+        os.chdir(_here)
+
+    timings["setup"] = time.time()-START
+    Execute(THIS_MODULE, CONTEXT, WORKSPACE, RELATIVE_OUTPUT_PATH, verbose, timings)
+
+if __name__ == '__main__':
+    START = time.time()
+    SRC = os.path.abspath(Path(__file__).joinpath('../../..'))
+    sys.path = list(set([SRC]+sys.path))
+    from _setup import ParseArgs
+    e = ParseArgs()
+    timings = {"start": START, "setup": time.time()-START}
+    timings.update(e.timings)
+    Execute(e.module, e.context, e.workspace, e.relative_output_path, e.verbose, timings)
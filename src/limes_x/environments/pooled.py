@@ -0,0 +1,24 @@
+import sys, os
+import json
+from pathlib import Path
+
+# persistent worker for PoolExecutor
+# reads one job per line from stdin and replies on the fd given as the only argument
+if __name__ == '__main__':
+    SRC = os.path.abspath(Path(__file__).joinpath('../../..'))
+    sys.path = list(set([SRC]+sys.path))
+    REPLIES = int(sys.argv[1])
+    from limes_x.environments.local import WarmWorker, RunInWorker
+    WarmWorker()
+
+    with os.fdopen(REPLIES, 'w') as replies:
+        for line in sys.stdin:
+            if line.strip() == "": continue
+            req = json.loads(line)
+            try:
+                RunInWorker(req["module_path"], req["workspace"], req["relative_output_path"], req["verbose"])
+                reply = dict(ok=True)
+            except Exception as e:
+                reply = dict(ok=False, error=f"{type(e).__name__}: {e}")
+            replies.write(json.dumps(reply)+'\n')
+            replies.flush()
@@ -0,0 +1,109 @@
+import sys, os
+import time
+import signal
+import socket
+import subprocess
+from pathlib import Path
+from threading import Thread, Event, Lock
+
+# worker for QueueExecutor, started with "python -m limes_x worker --workspace <workspace>"
+# claims jobs from the workspace's job queue and runs each like Executor does, with environments/local.py
+# with [parent_pid], exits once that process is gone, for workers started by QueueExecutor itself
+
+def Serve(workspace: str|Path, slots: int=1, poll_sec: float=2, idle_exit_sec: float|None=None, verbose: bool=False, parent_pid: int|None=None):
+    from limes_x.execution.comms import JobQueue
+    from limes_x.execution.modules import JobContext
+    from limes_x.execution.executors import Job
+    workspace = Path(os.path.abspath(workspace))
+    queue = JobQueue(workspace)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    entry_point = str(Path(__file__).absolute().parent.joinpath("local.py"))
+    env = dict(os.environ, PYTHONPATH=':'.join(os.path.abspath(p) for p in sys.path))
+    log = (lambda s: print(f"{time.strftime('%H:%M:%S')}> {s}", flush=True)) if verbose else (lambda s: None)
+
+    lock = Lock()
+    running: dict[str, subprocess.Popen] = {}
+    stop = Event()
+    def _on_signal(*args):
+        stop.set()
+    signal.signal(signal.SIGINT, _on_signal)
+    signal.signal(signal.SIGTERM, _on_signal)
+
+    def _heartbeat():
+        # a job whose lease was handed to another worker is killed here, so it doesn't run twice
+        while not stop.wait(queue.lease_sec/3):
+            with lock:
+                ids = list(running)
+            if len(ids) == 0: continue
+            for id in queue.Heartbeat(worker, ids):
+                with lock:
+                    p = running.get(id)
+                if p is None: continue
+                log(f"lost lease on {id}, stopping it")
+                try:
+                    os.killpg(p.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+    Thread(target=_heartbeat, daemon=True).start()
+
+    def _run(id: str, module_path: Path, output_folder: Path):
+        log(f"started {id}")
+        try:
+            timeout = JobContext.LoadFromDisk(workspace.joinpath(output_folder)).params.timeout_sec
+        except (OSError, ValueError):
+            timeout = None
+        p = subprocess.Popen(
+            [sys.executable, entry_point, str(module_path), str(workspace), str(output_folder), "False"],
+            cwd=workspace, env=env, start_new_session=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        with lock:
+            running[id] = p
+        try:
+            _, err = p.communicate(timeout=timeout)
+            error = err.decode(errors="replace")[-2000:]
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            p.communicate()
+            error = Job.TIMEOUT_MESSAGE.format(timeout)
+        with lock:
+            del running[id]
+        if stop.is_set(): return # given back to the queue
+        ok = p.returncode == 0
+        queue.Finish(worker, id, ok, "" if ok else error)
+        log(f"{'finished' if ok else 'failed'} {id}")
+
+    idle_since = time.time()
+    log(f"worker {worker} serving [{workspace}] with {slots} slots")
+    while not stop.is_set():
+        if parent_pid is not None and os.getppid() != parent_pid:
+            log(f"coordinator {parent_pid} is gone, exiting")
+            break
+        with lock:
+            free = slots - len(running)
+            busy = len(running) > 0
+        claimed = None
+        if free > 0:
+            claimed = queue.Claim(worker)
+        if claimed is not None:
+            Thread(target=_run, args=claimed, daemon=True).start()
+            idle_since = time.time()
+            continue
+        if busy: idle_since = time.time()
+        elif idle_exit_sec is not None and time.time()-idle_since >= idle_exit_sec:
+            log(f"idle for {idle_exit_sec}s, exiting")
+            break
+        stop.wait(poll_sec)
+
+    # give running jobs back to the queue for other workers
+    with lock:
+        returned = dict(running)
+    for id, p in returned.items():
+        queue.Return(worker, id)
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
@@ -1,91 +1,315 @@
 import os
-import json
+import time
+import socket
+import sqlite3
 from pathlib import Path
+from contextlib import contextmanager
 
-from ..common.utils import FileLock
+class IoSemaphore:
+    """cross process counting semaphore for io slots, one sqlite table in the workspace
+    - claims and releases are single transactions, no read-modify-write of a shared file
+    - waiters are admitted first come first served, a key can ask for several slots with [weight]
+    - smaller waiters may go ahead of one that doesn't fit yet, but only for [bypass_sec]
+    - slots are leases, renewed while the owning process keeps polling,
+    so a holder that crashed without releasing loses its slot after [lease_sec]
+    - holders may report how much they staged on release, see Samples
+    """
+    DEFAULT_NAME = "io_slots"
+    WAITING, HOLDING = 0, 1
 
-class FileSyncedDictionary:
-    DEFAULT_COMMS = "comms"
-    def __init__(self, workspace: Path, file_name: str|None=None, timeout: float=600) -> None:
+    def __init__(self, workspace: Path, capacity: int|None=None, lease_sec: float=3600, bypass_sec: float=600, file_name: str|None=None, timeout: float=600) -> None:
+        if file_name is None: file_name = self.DEFAULT_NAME
+        self._db = Path(os.path.abspath(workspace)).joinpath(f"{file_name}.db")
         self._timeout = timeout
-        if file_name is None: file_name = self.DEFAULT_COMMS
-        self._lock_file = workspace.joinpath(file_name)
-        self._data_file = workspace.joinpath(f"{file_name}.json")
-
-        with FileLock(self._lock_file, timeout=self._timeout):
-            if not os.path.exists(self._data_file):
-                with open(self._data_file, 'w') as f:
-                    json.dump({}, f)
-
-        self._lock: FileLock|None = None
-        self._data: dict = {}
-        self._original_data: dict = {}
-
-    def acquire(self):
-        data = self._data
-        if self._lock is None:
-            self._lock = FileLock(self._lock_file, timeout=self._timeout)
-            self._lock.acquire()
-            if os.path.exists(self._data_file):
-                with open(self._data_file) as j:
-                    try:
-                        data = json.load(j)
-                    except json.JSONDecodeError:
-                        data = {}
-        self._data = data
-        return CommsObject(data)
-            
-    def release(self):
-        if self._lock is not None:
-            l = self._lock
-            self._lock = None
-            with open(self._data_file, 'w') as j:
-                json.dump(self._data, j, separators=(',', ':'))
-            l.release()
-
-    def __enter__(self):
-        return self.acquire()
- 
-    def __exit__(self, type, value, traceback):
-        return self.release()
- 
-    def __del__(self):
-        self.release()
-
-class CommsObject:
-    IO_TASKS_KEY = 'io tasks'
-    QUEUED_TASKS_KEY = 'queued io tasks'
-    def __init__(self, data: dict) -> None:
-        self._data = data
+        self._lease_sec = lease_sec
+        self._bypass_sec = bypass_sec
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        with self._transaction() as cur:
+            cur.execute("""create table if not exists slots (
+                key text primary key, state int, weight int, owner text, queued real, expires real
+            )""")
+            cur.execute("create table if not exists meta (name text primary key, value real)")
+            cur.execute("create table if not exists stagings (finished real, bytes int, seconds real)")
+            if capacity is not None:
+                self._set_capacity(cur, capacity)
+
+    @contextmanager
+    def _transaction(self):
+        con = sqlite3.connect(self._db, timeout=self._timeout, isolation_level=None)
+        try:
+            cur = con.cursor()
+            cur.execute("pragma synchronous=off") # slots don't need to survive a power loss
+            cur.execute("begin immediate")
+            try:
+                yield cur
+                cur.execute("commit")
+            except:
+                cur.execute("rollback")
+                raise
+        finally:
+            con.close()
+
+    def _set_capacity(self, cur: sqlite3.Cursor, capacity: int):
+        cur.execute("insert or replace into meta values ('capacity', ?)", (max(1, capacity),))
+
+    def _get_capacity(self, cur: sqlite3.Cursor) -> int:
+        row = cur.execute("select value from meta where name='capacity'").fetchone()
+        return 1 if row is None else int(row[0])
+
+    def SetCapacity(self, capacity: int):
+        with self._transaction() as cur:
+            self._set_capacity(cur, capacity)
+            self._admit(cur)
+
+    def GetCapacity(self) -> int:
+        with self._transaction() as cur:
+            return self._get_capacity(cur)
+
+    def _admit(self, cur: sqlite3.Cursor):
+        # hand free slots to the longest waiting keys
+        capacity = self._get_capacity(cur)
+        held, = cur.execute("select coalesce(sum(min(weight, ?)), 0) from slots where state=?", (capacity, self.HOLDING)).fetchone()
+        free = capacity - held
+        if free <= 0: return
+        now = time.time()
+        admitted = []
+        waiting = cur.execute("select key, min(weight, ?), queued from slots where state=? order by rowid", (capacity, self.WAITING)).fetchall()
+        for key, weight, queued in waiting:
+            if weight <= free:
+                admitted.append((self.HOLDING, key))
+                free -= weight
+            elif now - queued >= self._bypass_sec:
+                break # reserve the remaining slots for this one
+            if free <= 0: break
+        cur.executemany("update slots set state=? where key=?", admitted)
+
+    def TryAcquire(self, key: str, weight: int=1) -> bool:
+        """claim [weight] slots for [key] if they are free and no earlier waiter is ahead,
+        otherwise [key] stays queued and is handed the slots when its turn comes
+        - weights larger than the capacity are treated as the whole capacity
+        """
+        now = time.time()
+        with self._transaction() as cur:
+            cur.execute("delete from slots where expires < ?", (now,))
+            cur.execute("update slots set expires=? where owner=?", (now+self._lease_sec, self._owner))
+            cur.execute("insert or ignore into slots values (?, ?, ?, ?, ?, ?)", (key, self.WAITING, max(1, weight), self._owner, now, now+self._lease_sec))
+            self._admit(cur)
+            state, = cur.execute("select state from slots where key=?", (key,)).fetchone()
+            return state == self.HOLDING
+
+    def Acquire(self, key: str, weight: int=1, poll_sec: float=1, timeout: float|None=None) -> bool:
+        deadline = None if timeout is None else time.time()+timeout
+        while not self.TryAcquire(key, weight):
+            if deadline is not None and time.time() >= deadline:
+                self.Release(key)
+                return False
+            time.sleep(poll_sec)
+        return True
+
+    def Release(self, key: str, staged_bytes: int|None=None, staged_sec: float|None=None):
+        """give back the slots of [key], optionally reporting what was staged while holding them"""
+        with self._transaction() as cur:
+            if staged_bytes is not None and staged_sec is not None:
+                cur.execute("insert into stagings values (?, ?, ?)", (time.time(), staged_bytes, staged_sec))
+            cur.execute("delete from slots where key=?", (key,))
+            self._admit(cur)
+
+    def Samples(self, since: float=0) -> list[tuple[float, int, float]]:
+        """reported stagings finished after [since], as (finished, bytes, seconds)"""
+        with self._transaction() as cur:
+            return cur.execute("select * from stagings where finished > ? order by finished", (since,)).fetchall()
+
+    def Holders(self) -> list[str]:
+        with self._transaction() as cur:
+            return [k for k, in cur.execute("select key from slots where state=? order by rowid", (self.HOLDING,))]
+
+    def Waiting(self) -> list[str]:
+        with self._transaction() as cur:
+            return [k for k, in cur.execute("select key from slots where state=? order by rowid", (self.WAITING,))]
 
     def Clear(self):
-        self._data.clear()
-
-    def SwitchIoTaskToActive(self, key: str):
-        q = self.GetIoTaskQueue()
-        if key not in q: return
-        q.remove(key)
-        lst = self.GetIoTasks()
-        if key not in lst:
-            lst.append(key)
-
-    def RemoveIoTask(self, key: str):
-        q = self.GetIoTaskQueue()
-        lst = self.GetIoTasks()
-        if key in q: q.remove(key)
-        if key in lst: lst.remove(key)
-
-    def GetIoTasks(self) -> list[str]:
-        if self.IO_TASKS_KEY not in self._data:
-            self._data[self.IO_TASKS_KEY] = []
-        return self._data[self.IO_TASKS_KEY]
-
-    def GetIoTaskQueue(self) -> list[str]:
-        if self.QUEUED_TASKS_KEY not in self._data:
-            self._data[self.QUEUED_TASKS_KEY] = []
-        return self._data[self.QUEUED_TASKS_KEY]
-
-    def QueueIoTask(self, key: str):
-        q = self.GetIoTaskQueue()
-        if key not in q: q.append(key)
+        with self._transaction() as cur:
+            cur.execute("delete from slots")
+            cur.execute("delete from stagings")
+
+class AdaptiveIoController:
+    """adjusts the capacity of an IoSemaphore to keep the aggregate staging throughput near a target
+    - additive increase while below [target_bytes_per_sec], multiplicative decrease when above it
+    - an increase that didn't raise the throughput means the filesystem is saturated, and is undone
+    - the aggregate is the bytes of stagings reported in the last [window_sec] over the time they spanned
+    - stagings smaller than [min_sample_bytes] are dominated by latency and are ignored
+    """
+    def __init__(self, slots: IoSemaphore, target_bytes_per_sec: float,
+        min_capacity: int=1, max_capacity: int=64,
+        increase: int=1, decrease: float=0.5, tolerance: float=0.1,
+        min_sample_bytes: int=64<<20, interval_sec: float=5, window_sec: float=300,
+    ) -> None:
+        self._slots = slots
+        self.target = target_bytes_per_sec
+        self.min_capacity, self.max_capacity = min_capacity, max_capacity
+        self._increase = increase
+        self._decrease = decrease
+        self._tolerance = tolerance
+        self._min_sample_bytes = min_sample_bytes
+        self._interval = interval_sec
+        self._window = window_sec
+        self._last_update = 0.0
+        self._last_sample = 0.0
+        self._last_throughput: float|None = None
+        self._increased = False
+        self.throughput: float|None = None
+
+    def Estimate(self, samples: list[tuple[float, int, float]]):
+        total, begin, end = 0, None, None
+        for finished, size, seconds in samples:
+            if size < self._min_sample_bytes or seconds <= 0: continue
+            total += size
+            begin = finished-seconds if begin is None else min(begin, finished-seconds)
+            end = finished if end is None else max(end, finished)
+        if begin is None or end is None or end <= begin: return None
+        return total/(end-begin)
+
+    def Update(self, force: bool=False) -> int|None:
+        """returns the new capacity, if it was changed"""
+        now = time.time()
+        if not force and now - self._last_update < self._interval: return None
+        self._last_update = now
+        samples = self._slots.Samples(since=now-self._window)
+        if len(samples) == 0 or samples[-1][0] <= self._last_sample: return None # nothing new
+        self._last_sample = samples[-1][0]
+        throughput = self.Estimate(samples)
+        if throughput is None: return None
+        self.throughput = throughput
+
+        capacity = current = self._slots.GetCapacity()
+        if self._increased and self._last_throughput is not None and throughput <= self._last_throughput*(1+self._tolerance):
+            capacity = current-self._increase
+        elif throughput > self.target*(1+self._tolerance):
+            capacity = int(current*self._decrease)
+        elif throughput < self.target*(1-self._tolerance):
+            capacity = current+self._increase
+        self._last_throughput = throughput
 
+        capacity = min(self.max_capacity, max(self.min_capacity, capacity))
+        self._increased = capacity > current
+        if capacity == current: return None
+        self._slots.SetCapacity(capacity)
+        return capacity
+
+class JobQueue:
+    """jobs waiting for, or claimed by, workers started with "python -m limes_x worker", one sqlite table in the workspace
+    - a claim is a lease that the worker renews with Heartbeat while the job runs,
+    a job whose worker stops heartbeating for [lease_sec] is given to another worker
+    - after [max_attempts] claims a job fails instead, since it likely takes its worker down with it
+    - finished jobs stay until the coordinator collects them with TakeFinished
+    - a [lease_sec] given by the coordinator is kept in the queue, so that its workers use it too
+    """
+    DEFAULT_NAME = "job_queue"
+    DEFAULT_LEASE_SEC = 120
+    READY, CLAIMED, FINISHED = 0, 1, 2
+
+    def __init__(self, workspace: Path, lease_sec: float|None=None, max_attempts: int=3, file_name: str|None=None, timeout: float=600) -> None:
+        if file_name is None: file_name = self.DEFAULT_NAME
+        self._db = Path(os.path.abspath(workspace)).joinpath(f"{file_name}.db")
+        self._timeout = timeout
+        self._max_attempts = max_attempts
+        with self._transaction() as cur:
+            cur.execute("""create table if not exists jobs (
+                id text primary key, module_path text, output_folder text, state int, worker text,
+                attempts int, queued real, expires real, ok int, error text
+            )""")
+            cur.execute("create table if not exists settings (key text primary key, value text)")
+            if lease_sec is not None:
+                cur.execute("insert or replace into settings values ('lease_sec', ?)", (str(lease_sec),))
+            self._read_settings(cur)
+
+    def _read_settings(self, cur: sqlite3.Cursor):
+        row = cur.execute("select value from settings where key='lease_sec'").fetchone()
+        self.lease_sec = float(row[0]) if row is not None else self.DEFAULT_LEASE_SEC
+
+    @contextmanager
+    def _transaction(self):
+        con = sqlite3.connect(self._db, timeout=self._timeout, isolation_level=None)
+        try:
+            cur = con.cursor()
+            cur.execute("pragma synchronous=off") # results are in each job's result.json
+            cur.execute("begin immediate")
+            try:
+                yield cur
+                cur.execute("commit")
+            except:
+                cur.execute("rollback")
+                raise
+        finally:
+            con.close()
+
+    def Put(self, job_id: str, module_path: Path, output_folder: Path):
+        with self._transaction() as cur:
+            cur.execute("insert or replace into jobs values (?, ?, ?, ?, null, 0, ?, null, null, null)",
+                (job_id, str(module_path), str(output_folder), self.READY, time.time()))
+
+    def Claim(self, worker: str) -> tuple[str, Path, Path]|None:
+        """the oldest ready job as (id, module path, output folder relative to the workspace), or None"""
+        now = time.time()
+        with self._transaction() as cur:
+            self._read_settings(cur)
+            lost = cur.execute("select id, attempts from jobs where state=? and expires < ?", (self.CLAIMED, now)).fetchall()
+            for id, attempts in lost:
+                if attempts >= self._max_attempts:
+                    cur.execute("update jobs set state=?, ok=0, error=? where id=?",
+                        (self.FINISHED, f"lost {attempts} workers while running", id))
+                else:
+                    cur.execute("update jobs set state=?, worker=null where id=?", (self.READY, id))
+            row = cur.execute("select id, module_path, output_folder from jobs where state=? order by queued limit 1", (self.READY,)).fetchone()
+            if row is None: return None
+            id, module_path, output_folder = row
+            cur.execute("update jobs set state=?, worker=?, attempts=attempts+1, expires=? where id=?",
+                (self.CLAIMED, worker, now+self.lease_sec, id))
+            return id, Path(module_path), Path(output_folder)
+
+    def Heartbeat(self, worker: str, job_ids: list[str]) -> list[str]:
+        """renews the leases of [worker] on [job_ids], returns those it no longer holds"""
+        with self._transaction() as cur:
+            self._read_settings(cur)
+            lost = []
+            for id in job_ids:
+                cur.execute("update jobs set expires=? where id=? and state=? and worker=?",
+                    (time.time()+self.lease_sec, id, self.CLAIMED, worker))
+                if cur.rowcount == 0: lost.append(id)
+            return lost
+
+    def Finish(self, worker: str, job_id: str, ok: bool, error: str=""):
+        with self._transaction() as cur:
+            cur.execute("update jobs set state=?, ok=?, error=? where id=? and state=? and worker=?",
+                (self.FINISHED, int(ok), error, job_id, self.CLAIMED, worker))
+
+    def Cancel(self, job_id: str, error: str="cancelled"):
+        """finishes a job as failed, if it is claimed, its worker finds out at its next heartbeat"""
+        with self._transaction() as cur:
+            cur.execute("update jobs set state=?, ok=0, error=? where id=? and state in (?, ?)",
+                (self.FINISHED, error, job_id, self.READY, self.CLAIMED))
+
+    def Return(self, worker: str, job_id: str):
+        """gives a claimed job back, to be run by any worker"""
+        with self._transaction() as cur:
+            cur.execute("update jobs set state=?, worker=null, attempts=max(0, attempts-1) where id=? and state=? and worker=?",
+                (self.READY, job_id, self.CLAIMED, worker))
+
+    def TakeFinished(self) -> list[tuple[str, bool, str]]:
+        """finished jobs as (id, ok, error), each is only returned once"""
+        with self._transaction() as cur:
+            rows = cur.execute("select id, ok, error from jobs where state=?", (self.FINISHED,)).fetchall()
+            cur.executemany("delete from jobs where id=?", [(id,) for id, _, _ in rows])
+            return [(id, ok == 1, "" if error is None else error) for id, ok, error in rows]
+
+    def Counts(self) -> dict[str, int]:
+        with self._transaction() as cur:
+            names = {self.READY: "ready", self.CLAIMED: "claimed", self.FINISHED: "finished"}
+            counts = dict((n, 0) for n in names.values())
+            for state, n in cur.execute("select state, count(*) from jobs group by state"):
+                counts[names[state]] = n
+            return counts
+
+    def Clear(self):
+        with self._transaction() as cur:
+            cur.execute("delete from jobs")
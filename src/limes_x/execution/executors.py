@@ -1,18 +1,26 @@
 from __future__ import annotations
 import os, sys
+import shutil
 import time
 import json
 from pathlib import Path
 from typing import Callable, Iterable
 import inspect
-from threading import Condition
+import hashlib
+from threading import Condition, Thread, Event, Lock, Timer
+import subprocess
+import signal
+from queue import Queue
 
 from .modules import ComputeModule, JobContext, JobResult, Params, Item
 from .instances import JobInstance
-from .comms import FileSyncedDictionary, CommsObject
-from ..common.utils import LiveShell, Timestamp, CurrentTimeMillis
+from .comms import IoSemaphore, AdaptiveIoController, JobQueue
+from ..common.utils import LiveShell, Timestamp
+from ..common.logs import RealtimeLog
+from ..common.fs import WaitForFile, TreeSize
 
 class Job:
+    TIMEOUT_MESSAGE = "timed out after {:g}s"
     instance: JobInstance
     context: JobContext
     run_command: str
@@ -23,6 +31,11 @@ class Job:
         self.instance = instance
         self.workspace = workspace
         self._verbose = True
+        self._lock = Lock()
+        self._killed = False
+        self._timed_out = False
+        self._kill: Callable[[], None]|None = None
+        self._cancel: Callable[[], None]|None = None # set by executors whose jobs outlive their shell
 
         c = JobContext()
         c.job_id = self.instance.GetID()
@@ -36,33 +49,79 @@ class Job:
     def Shell(self, cmd: str):
         err_log = []
         pr = lambda s: print(s, end="")
-        code=LiveShell(cmd, echo_cmd=False, onErr=lambda s: err_log.append(s), onOut=pr if self._verbose else lambda s: None)
+        def _on_start(process: subprocess.Popen):
+            def _kill():
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            self.OnKill(_kill)
+        code=LiveShell(cmd, echo_cmd=False, onErr=lambda s: err_log.append(s), onOut=pr if self._verbose else lambda s: None,
+            onStart=_on_start, new_session=True)
+        self.OnKill(None)
         return code==0, "".join(err_log)
 
+    def OnKill(self, kill: Callable[[], None]|None):
+        """sets how to stop this job while it runs, called right away if Kill already was"""
+        with self._lock:
+            self._kill = kill
+            if not self._killed or kill is None: return
+        kill()
+
+    def Kill(self):
+        with self._lock:
+            self._killed = True
+            kill, cancel = self._kill, self._cancel
+        if cancel is not None: cancel()
+        if kill is not None: kill()
+
 ExecutionHandler = Callable[[Job], tuple[bool, str]]
 SetupHandler = Callable[[list[ComputeModule], Path, Params], None]
 class Executor:
-    def __init__(self, execute_procedure: ExecutionHandler|None=None, prepare_procedure: SetupHandler|None=None) -> None:
+    def __init__(self, execute_procedure: ExecutionHandler|None=None, prepare_procedure: SetupHandler|None=None, cancellable: bool|None=None) -> None:
         self._execute_procedure: ExecutionHandler = execute_procedure if execute_procedure is not None else lambda j: j.Shell(j.run_command)
+        # Cancel kills the shell of Job.Shell, which a custom execute_procedure may not use
+        self._cancellable = cancellable if cancellable is not None else execute_procedure is None
         self._prepare_run = (lambda x, y, z: None) if prepare_procedure is None else prepare_procedure
         self._sync = Condition()
+        self._active: dict[str, Job] = {} # by job id
 
-    # currently not used
     def PrepareRun(self, modules: list[ComputeModule], inputs_folder: Path, params: Params):
+        """set up for a run, once, from the workspace, then prepare [modules]"""
+        self._setup_run(inputs_folder, params)
+        self.PrepareModules(modules, inputs_folder, params)
+
+    def PrepareModules(self, modules: list[ComputeModule], inputs_folder: Path, params: Params):
+        """prepare [modules] joining a run that is already going, with the prepare_procedure"""
         self._prepare_run(modules, inputs_folder, params)
 
+    def _setup_run(self, inputs_folder: Path, params: Params):
+        pass
+
+    def Shutdown(self):
+        """stop anything started for runs, called when Workflow.Run ends"""
+        pass
+
     def _print_start(self, job: Job):
         with self._sync:
             print(f"{Timestamp()}    - started {job.instance.step.name}:{job.instance.GetID()}")
             sys.stdout.flush()
 
     def _override_params(self, job: Job):
-        step = job.instance.step
         params = job.context.params
-        if step.threads is not None: params.threads = step.threads
-        if step.memory_gb is not None: params.mem_gb = step.memory_gb
+        params.threads, params.mem_gb = self._module_resources(job.instance.step, params)
         return job
 
+    def _module_resources(self, step: ComputeModule, params: Params):
+        if params.pin_resources: return params.threads, params.mem_gb
+        threads = step.threads if step.threads is not None else params.threads
+        mem_gb = step.memory_gb if step.memory_gb is not None else params.mem_gb
+        return threads, mem_gb
+
+    def JobResources(self, step: ComputeModule, params: Params) -> tuple[int, int]:
+        """threads and memory in GB that a job of [step] runs with, given [params]"""
+        return params.threads, params.mem_gb
+
     def _make_job(self, instance: JobInstance, workspace: Path, params: Params, _save=True, _override=False):
         job = Job(
             instance = instance,
@@ -72,8 +131,37 @@ class Executor:
         )
         if _override: job = self._override_params(job)
         if _save: job.context.Save(workspace=workspace)
+        with self._sync:
+            self._active[instance.GetID()] = job
         return job
 
+    def _start_timeout(self, job: Job) -> Timer|None:
+        """kills [job] after params.timeout_sec, cancel the returned timer once it ends"""
+        timeout = job.context.params.timeout_sec
+        if timeout is None: return None
+        def _time_out():
+            job._timed_out = True
+            job.Kill()
+        timer = Timer(timeout, _time_out)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def Cancel(self, instance: JobInstance):
+        """stops a submitted job, whose result still comes back as a failure
+        - jobs are stopped by killing the process group of their shell, so an execute_procedure
+        or hpc_procedure that doesn't use Job.Shell can't be cancelled
+        """
+        with self._sync:
+            job = self._active.get(instance.GetID())
+        if job is not None: job.Kill()
+
+    def CanCancel(self) -> bool:
+        """whether Cancel actually stops a job's work, rather than just waiting on it less,
+        for a custom execute_procedure only if the executor was made with [cancellable]
+        """
+        return self._cancellable
+
     def Run(self, instance: JobInstance, workspace: Path, params: Params) -> JobResult:
         job = self._make_job(instance, workspace, params)
 
@@ -87,11 +175,37 @@ class Executor:
             python {" ".join(f'"{a}"' for a in args)}
         """[:-1].replace("  ", "")
         # self._print_start(job)
+        timer = self._start_timeout(job)
         success, msg = self._execute_procedure(job)
+        if timer is not None: timer.cancel()
 
         return self._compile_result(job, success, msg)
 
+    def Submit(self, instance: JobInstance, workspace: Path, params: Params, on_done: Callable[[JobResult], None]):
+        """runs the job in the background and calls [on_done] with its result,
+        by default with a thread per job, executors that don't need one override this
+        """
+        def _job():
+            try:
+                result = self.Run(instance, workspace, params)
+            except Exception as e:
+                result = JobResult(
+                    exit_code = 1,
+                    error_message = str(e),
+                    made_by = instance.GetID(),
+                )
+            on_done(result)
+        Thread(target=_job, daemon=True).start()
+
     def _compile_result(self, job: Job, success: bool, msg: str):
+        with self._sync:
+            if self._active.get(job.instance.GetID()) is job: del self._active[job.instance.GetID()]
+        if not success and job._timed_out:
+            r = JobResult()
+            r.made_by = job.instance.GetID()
+            r.error_message = Job.TIMEOUT_MESSAGE.format(job.context.params.timeout_sec)
+            r.timed_out = True
+            return r
         if not success:
             return self._make_failed_result(job.instance, msg)
         else:
@@ -99,13 +213,9 @@ class Executor:
 
     def _get_result(self, context: JobContext, job: JobInstance) -> JobResult:
         result_json = context.output_folder.joinpath('result.json')
-        if not os.path.exists(result_json):
-            w = context.params.file_system_wait_sec
-            if w > 0:
-                print(f"waiting {w} sec. for {job.step.name}:{job.GetID()}")
-                time.sleep(w)
-
-        if os.path.exists(result_json):
+        # the job wrapper renames result.json into place when done, on shared filesystems
+        # it can take a moment to show up here, so wait for it, at most file_system_wait_sec
+        if WaitForFile(result_json, timeout=float(context.params.file_system_wait_sec)):
             err_msg = None
             try:
                 with open(result_json) as j:
@@ -115,8 +225,7 @@ class Executor:
                         r.error_message = f"no output created{'' if r.error_message is None else f', err: {r.error_message}'}"
                         r.manifest = {}
                     else:
-                        realtime_log = context.output_folder.joinpath("realtime.log")
-                        if os.path.exists(realtime_log): os.remove(realtime_log)
+                        RealtimeLog.Remove(context.output_folder.joinpath("realtime.log"))
                     return r
             except Exception as e:
                 err_msg = f'result manifest corrupted'
@@ -137,7 +246,190 @@ class Executor:
         r.error_message = f"executor failed:\n{msg}"
         return r
 
+class _WarmWorker:
+    def __init__(self) -> None:
+        from ..environments import pooled
+        entry_point = os.path.abspath(inspect.getfile(pooled))
+        replies_r, replies_w = os.pipe()
+        env = os.environ.copy()
+        env["PYTHONPATH"] = ':'.join(os.path.abspath(p) for p in sys.path)
+        self._process = subprocess.Popen(
+            [sys.executable, entry_point, str(replies_w)],
+            stdin=subprocess.PIPE, pass_fds=(replies_w,), env=env, start_new_session=True,
+        )
+        os.close(replies_w)
+        self._replies = os.fdopen(replies_r)
+
+    def Alive(self):
+        return self._process.poll() is None
+
+    def Execute(self, module_path: Path, workspace: Path, relative_output_path: Path, verbose: bool) -> tuple[bool, str]:
+        stdin = self._process.stdin
+        assert stdin is not None
+        req = dict(module_path=str(module_path), workspace=str(workspace), relative_output_path=str(relative_output_path), verbose=verbose)
+        try:
+            stdin.write(f"{json.dumps(req)}\n".encode())
+            stdin.flush()
+            reply = self._replies.readline()
+        except (BrokenPipeError, ValueError):
+            reply = ""
+        if reply == "":
+            return False, f"worker died with exit code [{self._process.wait()}]"
+        reply = json.loads(reply)
+        return reply["ok"], reply.get("error", "")
+
+    def Kill(self):
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def Stop(self):
+        if self._process.stdin is not None and not self._process.stdin.closed:
+            self._process.stdin.close()
+        self._process.wait()
+        self._replies.close()
+
+class PoolExecutor(Executor):
+    """runs procedures in persistent worker processes, instead of a new interpreter per job
+    - workers import limes_x once and keep loaded module definitions
+    - result.json and logs are written exactly as with the local executor
+    """
+    def __init__(self, workers: int|None=None, prepare_procedure: SetupHandler|None=None) -> None:
+        super().__init__(prepare_procedure=prepare_procedure)
+        self._max_workers = workers if workers is not None else (os.cpu_count() or 1)
+        self._idle: Queue[_WarmWorker] = Queue()
+        self._started = 0
+
+    def _take_worker(self) -> _WarmWorker:
+        with self._sync:
+            if self._idle.empty() and self._started < self._max_workers:
+                self._started += 1
+                return _WarmWorker()
+        worker = self._idle.get()
+        if not worker.Alive():
+            worker.Stop()
+            worker = _WarmWorker()
+        return worker
+
+    def Shutdown(self):
+        with self._sync:
+            while not self._idle.empty():
+                self._idle.get().Stop()
+                self._started -= 1
+
+    def _execute_in_pool(self, job: Job) -> tuple[bool, str]:
+        worker = self._take_worker()
+        job.OnKill(worker.Kill) # the worker is replaced when next taken
+        timer = self._start_timeout(job)
+        try:
+            return worker.Execute(job.instance.step.location, job.workspace, job.context.output_folder, False)
+        except Exception as e:
+            return False, str(e)
+        finally:
+            if timer is not None: timer.cancel()
+            job.OnKill(None)
+            self._idle.put(worker)
+
+    def Run(self, instance: JobInstance, workspace: Path, params: Params) -> JobResult:
+        job = self._make_job(instance, workspace, params)
+        job.run_command = "" # ran in a pooled worker
+        success, msg = self._execute_in_pool(job)
+        return self._compile_result(job, success, msg)
+
+class QueueExecutor(Executor):
+    """puts jobs in a queue in the workspace for workers to claim, instead of running them
+    - start workers on any machine that sees the workspace with "python -m limes_x worker --workspace <workspace>"
+    - workers run each job like the local executor, results are collected by one thread, not one per job
+    - with [local_workers], that many workers are also started on this machine, stopped by Shutdown at the end of Workflow.Run,
+    or when this process exits
+    """
+    def __init__(self, local_workers: int=0, poll_sec: float=1, lease_sec: float=120, prepare_procedure: SetupHandler|None=None) -> None:
+        self._local_workers = local_workers
+        self._poll_sec = poll_sec
+        self._lease_sec = lease_sec
+        self._queues: dict[Path, JobQueue] = {}
+        self._waiting: dict[str, tuple[Job, Callable[[JobResult], None]]] = {}
+        self._collector: Thread|None = None
+        self._workers: list[subprocess.Popen] = []
+        super().__init__(prepare_procedure=prepare_procedure)
+
+    def _setup_run(self, inputs_folder: Path, params: Params):
+        workspace = Path(os.getcwd())
+        self._get_queue(workspace).Clear() # jobs of an earlier coordinator
+        while len(self._workers) < self._local_workers:
+            self._workers.append(subprocess.Popen(
+                [sys.executable, "-m", "limes_x", "worker", "--workspace", str(workspace), "--poll-sec", str(self._poll_sec), "--parent-pid", str(os.getpid())],
+                env=dict(os.environ, PYTHONPATH=':'.join(os.path.abspath(p) for p in sys.path)),
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ))
+
+    def _get_queue(self, workspace: Path):
+        with self._sync:
+            q = self._queues.get(workspace)
+            if q is None:
+                q = JobQueue(workspace, lease_sec=self._lease_sec)
+                self._queues[workspace] = q
+            return q
+
+    def Submit(self, instance: JobInstance, workspace: Path, params: Params, on_done: Callable[[JobResult], None]):
+        job = self._make_job(instance, workspace, params)
+        job.run_command = "" # ran by a worker
+        with self._sync:
+            self._waiting[instance.GetID()] = job, on_done
+            if self._collector is None:
+                self._collector = Thread(target=self._collect, daemon=True)
+                self._collector.start()
+        q = self._get_queue(workspace)
+        q.Put(instance.GetID(), instance.step.location, job.context.output_folder)
+        job.OnKill(lambda: q.Cancel(instance.GetID())) # the worker running it stops it at its next heartbeat
+
+    def Run(self, instance: JobInstance, workspace: Path, params: Params) -> JobResult:
+        done = Event()
+        results: list[JobResult] = []
+        def _on_done(r: JobResult):
+            results.append(r)
+            done.set()
+        self.Submit(instance, workspace, params, _on_done)
+        done.wait()
+        return results[0]
+
+    def _collect(self):
+        while True:
+            time.sleep(self._poll_sec)
+            with self._sync:
+                queues = list(self._queues.values())
+            for q in queues:
+                for id, ok, error in q.TakeFinished():
+                    with self._sync:
+                        waiting = self._waiting.pop(id, None)
+                    if waiting is None: continue
+                    job, on_done = waiting
+                    # workers enforce timeouts, see environments/queued.py
+                    timeout = job.context.params.timeout_sec
+                    job._timed_out = not ok and timeout is not None and error == Job.TIMEOUT_MESSAGE.format(timeout)
+                    try:
+                        result = self._compile_result(job, ok, error)
+                    except Exception as e:
+                        result = self._make_failed_result(job.instance, str(e))
+                    on_done(result)
+
+    def Shutdown(self):
+        for w in self._workers:
+            w.terminate()
+        for w in self._workers:
+            w.wait()
+        self._workers = []
+
 class HpcExecutor(Executor):
+    """runs each job through [hpc_procedure], which submits it to the cluster's scheduler and waits for it
+    - params.timeout_sec is enforced on the node, from when the module starts running, so that time spent
+    queued by the scheduler doesn't count, hpc_procedure can use it to set the scheduler's own limit (e.g. sbatch --time)
+    - a cancelled job has the shell of its hpc_procedure killed, which only stops
+    the local submit command (e.g. sbatch --wait), not the job on the cluster
+    - give [cancel_procedure] to also stop it on the cluster, it is called with the job before its shell is killed,
+    e.g. to run scancel with the job name given to sbatch
+    """
     _EXT = 'tgz'
     _SRC_FOLDER_NAME = 'limesx_src'
     _NO_ZIP = ['tgz', 'tar.gz', 'sif']
@@ -147,53 +439,120 @@ class HpcExecutor(Executor):
         logistical_procedure: ExecutionHandler|None=None,
         prerun: Callable[[Path], None] | None = None,
         tmp_dir_name: str="TMP",
+        reference_cache: str|None=None,
+        reference_cache_gb: float=100,
+        cancel_procedure: Callable[[Job], None]|None=None,
     ) -> None:
+        super().__init__(execute_procedure=logistical_procedure)
+        self._prerun = prerun
+        self._cancel_procedure = cancel_procedure
+        self._hpc_procedure = hpc_procedure
+        self._tmp_dir_name = tmp_dir_name
+        self._src_bundle = f"{self._SRC_FOLDER_NAME}.{self._EXT}"
+        self._reference_cache = reference_cache
+        self._reference_cache_gb = reference_cache_gb
+        self.max_active_io_jobs: int = 5 # io slots, the starting point if adaptive
+        self.update_frequency: int|float = 5
+        self.target_io_mb_per_sec: float|None = None # adapt io slots to keep staging near this throughput
+        self.io_capacity_range: tuple[int, int] = (1, 64)
+        self.io_slot_gb: float = 10 # jobs staging more than this take more than one io slot
+        self._io_slots: dict[Path, IoSemaphore] = {}
+        self._io_controllers: dict[Path, AdaptiveIoController] = {}
+        self._requirement_sizes: dict[Path, int] = {}
 
-        def _prepare_run(modules: list[ComputeModule], inputs_dir: Path, params: Params):
-            _shell = lambda cmd: LiveShell(cmd=cmd.replace('  ', ''), echo_cmd=False)
-            HERE = os.getcwd()
-            EXT = self._EXT
-            THREADS = params.threads
+    def _setup_run(self, inputs_folder: Path, params: Params):
+        _shell = lambda cmd: LiveShell(cmd=cmd.replace('  ', ''), echo_cmd=False)
+        HERE = os.getcwd()
+        EXT = self._EXT
+        THREADS = params.threads
 
-            ## limes_x env ##
-            import limes_x
-            src = os.path.abspath(Path(os.path.dirname(inspect.getfile(limes_x))).joinpath('..'))
+        ## limes_x env ##
+        import limes_x
+        src = os.path.abspath(Path(os.path.dirname(inspect.getfile(limes_x))).joinpath('..'))
+        # keyed by content, so it is only rebuilt when limes_x changes
+        bundle = f"{self._SRC_FOLDER_NAME}-{self._hash_source(Path(src).joinpath(limes_x.__name__))}.{EXT}"
+        self._src_bundle = bundle
+        if not os.path.exists(bundle):
+            zipper = f"pigz -5 -p {THREADS}" if shutil.which("pigz") is not None else "gzip -5"
             _shell(f"""\
                 cd {src}
-                tar --exclude=__pycache__ -hcf - {limes_x.__name__} | pigz -5 -p {THREADS} >{HERE}/{self._SRC_FOLDER_NAME}.{EXT}
-            """)    
-            if prerun is not None: prerun(inputs_dir)
+                tar --exclude=__pycache__ -hcf - {limes_x.__name__} | {zipper} >{HERE}/.{bundle}.tmp
+            """)
+            os.replace(f".{bundle}.tmp", bundle)
+        for old in Path(HERE).glob(f"{self._SRC_FOLDER_NAME}*.{EXT}"):
+            if old.name != bundle: os.remove(old)
+        if self._prerun is not None: self._prerun(inputs_folder)
+        sys.stdout.flush()
+
+    @classmethod
+    def _hash_source(cls, folder: Path):
+        h = hashlib.sha1()
+        for root, dirs, files in os.walk(folder, followlinks=True):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            for f in sorted(files):
+                if f.endswith(".pyc"): continue
+                p = os.path.join(root, f)
+                h.update(os.path.relpath(p, folder).encode())
+                with open(p, 'rb') as file:
+                    h.update(file.read())
+        return h.hexdigest()[:12]
+
+    def CanCancel(self) -> bool:
+        return self._cancel_procedure is not None
+
+    def JobResources(self, step: ComputeModule, params: Params) -> tuple[int, int]:
+        # jobs are made with _override, see Run
+        return self._module_resources(step, params)
+
+    def _cancel_job(self, job: Job):
+        assert self._cancel_procedure is not None
+        try:
+            self._cancel_procedure(job)
+        except Exception as e:
+            print(f"ERROR: cancelling {job.context.job_id}: {e}")
             sys.stdout.flush()
-            
-        super().__init__(execute_procedure=logistical_procedure, prepare_procedure=_prepare_run)
-        self._hpc_procedure = hpc_procedure
-        self._tmp_dir_name = tmp_dir_name
-        self.max_active_io_jobs: int = 5
-        self.update_frequency: int|float = 5
-        self._num_active_io: int = 0
-        self._last_check: int = 0
-        self._first_run = True
-
-    def _can_run(self, workspace: Path, key: str, force_update: bool=False):
-        elapsed = (CurrentTimeMillis() - self._last_check)/1000.0
-        def _update():
-            perm = False
-            with FileSyncedDictionary(workspace) as com:
-                if self._first_run:
-                    com.Clear()
-                    self._first_run = False
-                if len(com.GetIoTasks()) < self.max_active_io_jobs:
-                    com.QueueIoTask(key)
-                    com.SwitchIoTaskToActive(key)
-                    perm = True
-                self._num_active_io = len(com.GetIoTasks())
-            return perm
-
-        permission = False
-        if force_update or elapsed >= self.update_frequency or self._num_active_io < self.max_active_io_jobs:
-            permission = _update()
-            self._last_check = CurrentTimeMillis()
-        return permission
+
+    def _get_io_slots(self, workspace: Path):
+        with self._sync:
+            slots = self._io_slots.get(workspace)
+            if slots is None:
+                slots = IoSemaphore(workspace, capacity=self.max_active_io_jobs)
+                self._io_slots[workspace] = slots
+                if self.target_io_mb_per_sec is not None:
+                    lo, hi = self.io_capacity_range
+                    self._io_controllers[workspace] = AdaptiveIoController(
+                        slots, self.target_io_mb_per_sec*(1<<20),
+                        min_capacity=lo, max_capacity=hi,
+                        interval_sec=self.update_frequency,
+                    )
+            return slots
+
+    def _staging_bytes(self, job: Job):
+        total = 0
+        for ps in job.context.manifest.values():
+            for p in ps if isinstance(ps, list) else [ps]:
+                if isinstance(p, Path): total += TreeSize(job.workspace.joinpath(p))
+        for req in job.instance.step.requirements:
+            path = job.context.params.reference_folder.joinpath(req)
+            with self._sync:
+                size = self._requirement_sizes.get(path)
+            if size is None:
+                size = TreeSize(path)
+                with self._sync:
+                    self._requirement_sizes[path] = size
+            total += size
+        return total
+
+    def _io_weight(self, job: Job):
+        return 1 + int(self._staging_bytes(job) // (self.io_slot_gb*(1<<30)))
+
+    def _can_run(self, workspace: Path, key: str, weight: int=1):
+        slots = self._get_io_slots(workspace)
+        controller = self._io_controllers.get(workspace)
+        if controller is not None:
+            with self._sync:
+                controller.Update()
+        return slots.TryAcquire(key, weight)
 
     def Run(self, instance: JobInstance, workspace: Path, params: Params) -> JobResult:
         job = self._make_job(instance, workspace, params, _override=True)
@@ -202,7 +561,8 @@ class HpcExecutor(Executor):
         entry_point = Path(os.path.abspath(inspect.getfile(hpc)))
         args = [
             entry_point, job.instance.step.location, workspace, job.context.output_folder, False,
-            workspace.joinpath(f'{self._SRC_FOLDER_NAME}.{self._EXT}'), self._tmp_dir_name,
+            workspace.joinpath(self._src_bundle), self._tmp_dir_name,
+            self._reference_cache if self._reference_cache is not None else "", self._reference_cache_gb,
         ]
         job.run_command = f"""\
             python {" ".join(f'"{a}"' for a in args)}\
@@ -212,11 +572,12 @@ class HpcExecutor(Executor):
         success, msg = False, ""
         try:
             me = job.context.job_id
-            if not self._can_run(workspace, me, force_update=True):
-                while not self._can_run(workspace, me):
-                    time.sleep(self.update_frequency)
+            weight = self._io_weight(job)
+            while not self._can_run(workspace, me, weight):
+                time.sleep(self.update_frequency)
             # print(f"- started {job.context.job_id}")
             # self._print_start(job)
+            if self._cancel_procedure is not None: job._cancel = lambda: self._cancel_job(job)
             success, msg = self._hpc_procedure(job)
         except Exception as e:
             success, msg = False, str(e)
@@ -226,8 +587,8 @@ class HpcExecutor(Executor):
             success, msg = False, "force stopped"
             print(f"force stopped")
         finally:
-            with FileSyncedDictionary(workspace) as com:
-                com.RemoveIoTask(job.context.job_id)
+            job._cancel = None
+            self._get_io_slots(workspace).Release(job.context.job_id)
 
         result = self._compile_result(job, success, msg)
         return result
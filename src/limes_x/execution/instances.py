@@ -19,6 +19,7 @@ class _with_hashable_id:
 
 class JobInstance(_with_hashable_id):
     __ID_LENGTH = 6
+    DUPLICATE_SUFFIX = "-dup"
     def __init__(self, id_gen: Callable[[int], str], step: ComputeModule,
         inputs: dict[str, ItemInstance|list[ItemInstance]]) -> None:
         super().__init__(id_gen(JobInstance.__ID_LENGTH))
@@ -61,6 +62,10 @@ class JobInstance(_with_hashable_id):
     def GetFolderName(self):
         return f"{self.step.name}--{self.GetID()}"
 
+    def Duplicate(self):
+        """a copy of this job with its own id, and so its own output folder, to run alongside it"""
+        return JobInstance(lambda _: f"{self.GetID()}{JobInstance.DUPLICATE_SUFFIX}", self.step, self.inputs)
+
     def ToDict(self):
         def _dictify(data: dict[str, ItemInstance|list[ItemInstance]]):
             return dict((k, v.GetID() if isinstance(v, ItemInstance) else [ii.GetID() for ii in v]) for k, v in data.items())
@@ -1,13 +1,10 @@
 from __future__ import annotations
 import os, sys
 from pathlib import Path
-import shutil
-import importlib
+import importlib.util
 from typing import Callable, Iterable, Any, Literal
 import json
 
-from limes_x.common.utils import LiveShell
-
 from .solver import Transform
 from ..common.utils import AutoPopulate, PrivateInit
 
@@ -41,11 +38,19 @@ class Params:
         threads: int=4,
         mem_gb: int=8,
         reference_folder: Path=Path(''),
+        link_strategy: str="auto",
+        pin_resources: bool=False,
+        timeout_sec: float|None=None,
     ) -> None:
         self.file_system_wait_sec = file_system_wait_sec
         self.threads = threads
         self.mem_gb = mem_gb
         self.reference_folder = reference_folder
+        self.link_strategy = link_strategy # symlink, hardlink, reflink, copy, or auto, see common.fs.Link
+        # set by RetryPolicy after a job runs out of memory, so that executors use threads and mem_gb as they are,
+        # rather than the module's suggested resources
+        self.pin_resources = pin_resources
+        self.timeout_sec = timeout_sec # wall clock, after which the executor kills the job
 
     def Copy(self):
         cp = Params(**self.__dict__)
@@ -62,6 +67,8 @@ class Params:
                 'reference_folder': lambda: Path(val),
                 'threads': lambda: int(val),
                 'mem_gb': lambda: int(val), 
+                'pin_resources': lambda: val in {True, "True"},
+                'timeout_sec': lambda: None if val in {None, "None"} else float(val),
             }.get(k, lambda: val)()
             setattr(p, k, val)
         return p
@@ -109,7 +116,21 @@ class JobContext(AutoPopulate):
         super().__init__(**kwargs)
         if self.shell_prefix is None: self.shell_prefix = ""
 
+    def Link(self, src: str|Path, dst: str|Path|None=None, strategy: str|None=None) -> Path:
+        """make [src] available at [dst] without copying if possible, instead of shelling out to cp
+        - [dst] defaults to a file of the same name in the output folder
+        - [strategy] defaults to params.link_strategy
+        - modify the result only if it was copied or reflinked, see common.fs.Link
+        """
+        from ..common.fs import Link
+        src = Path(src)
+        dst = self.output_folder.joinpath(src.name) if dst is None else Path(dst)
+        if strategy is None: strategy = self.params.link_strategy if self.params is not None else "auto"
+        Link(src, dst, strategy)
+        return dst
+
     def Save(self, workspace: Path):
+        import shutil
         folder = workspace.joinpath(self.output_folder)
         if folder.exists():
             shutil.rmtree(folder)
@@ -159,6 +180,8 @@ class JobResult(AutoPopulate):
     resource_log: list[str]
     err_log: list[str]
     out_log: list[str]
+    timings: dict[str, float] # phase name to seconds, "start" is epoch seconds
+    timed_out: bool # killed by the executor after params.timeout_sec
 
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
@@ -199,7 +222,7 @@ class ComputeModule(PrivateInit):
     SETUP_FOLDER = 'setup'
     _group_by: dict[Item, Item] # key grouped by val
     def __init__(self,
-        procedure: Callable[[JobContext], JobResult],
+        procedure: Callable[[JobContext], JobResult]|None,
         inputs: set[Item],
         group_by: dict[Item, Item],
         outputs: set[Item],
@@ -212,13 +235,15 @@ class ComputeModule(PrivateInit):
     ) -> None:
 
         super().__init__(_key=kwargs.get('_key'))
+        assert procedure is not None or name is not None
         self.name = procedure.__name__ if name is None else name
         assert self.name != ""
         assert len(inputs.intersection(outputs)) == 0
         self.inputs = inputs
         self._group_by = group_by
         self.outputs = outputs
-        self._procedure = procedure
+        self._loaded_procedure = procedure
+        self.source_hash: str|None = kwargs.get('source_hash')
         self.location = Path(location).absolute()
         self.output_mask: set[Item] = set()
         self.threads = threads
@@ -226,6 +251,7 @@ class ComputeModule(PrivateInit):
         self.requirements = requirements
 
     def Setup(self, reference_folder: Path, install_type: str):
+        from ..common.utils import LiveShell
         snakefile = f"{self.location}/setup/setup.smk"
         print(f'setup {self.name} {">"*(50-len(self.name))}')
         if os.path.exists(snakefile):
@@ -236,23 +262,22 @@ class ComputeModule(PrivateInit):
             print("no setup defined")
         print()
 
+    @property
+    def _procedure(self) -> Callable[[JobContext], JobResult]:
+        # modules from the registry only import their definition when first run
+        if self._loaded_procedure is None:
+            self._loaded_procedure = ComputeModule._load(self.location)._loaded_procedure
+        assert self._loaded_procedure is not None
+        return self._loaded_procedure
+
     def Grouped(self, item: Item):
         return self._group_by.get(item)
 
     @classmethod
     def LoadSet(cls, modules_path: str|Path):
-        modules_path = Path(modules_path)
-        compute_modules: list[ComputeModule] = []
-        for dir in os.listdir(modules_path):
-            mpath = modules_path.joinpath(dir)
-            if not os.path.isdir(mpath): continue
-            try:
-                m = ComputeModule._load(mpath)
-                compute_modules.append(m)
-            except AssertionError:
-                print(f"[{dir}] failed to load")
-                continue
-        return compute_modules
+        # described from the registry's cache, without importing any module code
+        from .registry import ModuleRegistry
+        return ModuleRegistry(modules_path).Load()
 
     @classmethod
     def _load(cls, folder_path: str|Path):
@@ -267,8 +292,12 @@ class ComputeModule(PrivateInit):
         # os.chdir(folder_path.joinpath('..'))
         sys.path = [str(folder_path.joinpath(cls.LIB_FOLDER))]+sys.path
         try:
-            import definition as mo # type: ignore
-            importlib.reload(mo)
+            # a fresh module object per definition, reloading a shared "definition"
+            # would overwrite the globals of procedures that were loaded before
+            spec = importlib.util.spec_from_file_location("definition", folder_path.joinpath(f'{cls.LIB_FOLDER}/{cls.DEFINITION_FILE_NAME}'))
+            assert spec is not None and spec.loader is not None, err_msg
+            mo = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mo)
 
             module: ComputeModule = mo.MODULE
 
@@ -380,6 +409,7 @@ class ModuleBuilder(AutoPopulate):
         modules_folder: str|Path,
         name: str,
         on_exist: Literal['error']|Literal['overwrite']|Literal['skip']='error'):
+        import shutil
         modules_folder = Path(modules_folder)
 
         name = name.replace('/', '_').replace(' ', '-')
@@ -0,0 +1,106 @@
+from __future__ import annotations
+import os
+from pathlib import Path
+from queue import Queue, Empty
+from threading import Thread
+from typing import Any
+
+from .modules import Item
+from .instances import JobInstance
+from ..common.fs import TreeSize
+
+class OutputPublisher:
+    """links the targets made by each job into outputs/<item>/ from a background thread
+    - results are queued by Publish, so the workflow's result loop never waits on the filesystem
+    - queued results are written in batches, with folders created once and text files opened once per batch
+    - each item's folder has an index.tsv of job id, item instance id, path relative to the workspace, and size
+    - with [shard_chars] > 0, links go into subfolders named by the first characters of the job id,
+    so no single folder grows to hundreds of thousands of entries
+    """
+    INDEX_FILE = "index.tsv"
+    INDEX_HEADER = ["job_id", "instance_id", "path", "size"]
+    BATCH_SIZE = 512
+
+    def __init__(self, output_dir: Path, shard_chars: int=0) -> None:
+        self.output_dir = Path(os.path.abspath(output_dir))
+        self._workspace = self.output_dir.parent
+        self._shard_chars = shard_chars
+        self._queue: Queue[tuple[str, list[str], Item, list[Any]]|None] = Queue()
+        self._known_dirs: set[Path] = set()
+        self._worker = Thread(target=self._loop, daemon=True)
+        self._worker.start()
+
+    def Publish(self, job_instance: JobInstance, target: Item, values: str|Path|list[str]|list[Path]):
+        _values: Any = values
+        if not isinstance(values, list): _values = [values]
+        instances = [] if job_instance.outputs is None else job_instance.outputs.get(target.key, [])
+        if not isinstance(instances, list): instances = [instances]
+        instance_ids = [i.GetID() for i in instances]
+        self._queue.put((job_instance.GetID(), instance_ids, target, _values))
+
+    def Flush(self):
+        """wait until everything published so far is written"""
+        self._queue.join()
+
+    def Close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                pass
+            done = any(b is None for b in batch)
+            try:
+                self._write([b for b in batch if b is not None])
+            except Exception as e:
+                print(f"ERROR: publishing outputs: {e}")
+            for _ in batch: self._queue.task_done()
+            if done: return
+
+    def _folder_for(self, target: Item):
+        def _ok_for_path(c: str):
+            return c.isalpha() or c.isdigit() or c in "-_()[]+=:.?"
+        item_name = "".join([c if _ok_for_path(c) else "_" for c in target.key]).rstrip()
+        return self.output_dir.joinpath(item_name)
+
+    def _ensure_dir(self, folder: Path):
+        if folder in self._known_dirs: return
+        os.makedirs(folder, exist_ok=True)
+        self._known_dirs.add(folder)
+
+    def _write(self, batch: list[tuple[str, list[str], Item, list[Any]]]):
+        index_lines: dict[Path, list[str]] = {}
+        text_lines: dict[Path, list[str]] = {}
+        for job_id, instance_ids, target, values in batch:
+            item_dir = self._folder_for(target)
+            self._ensure_dir(item_dir)
+            link_dir = item_dir if self._shard_chars <= 0 else item_dir.joinpath(job_id[:self._shard_chars])
+            self._ensure_dir(link_dir)
+            index = index_lines.setdefault(item_dir.joinpath(self.INDEX_FILE), [])
+            for i, p in enumerate(values): # paths should be relative to ws
+                instance_id = instance_ids[i] if i < len(instance_ids) else "-"
+                original = self._workspace.joinpath(p) if isinstance(p, Path) else None
+                if original is not None and original.exists():
+                    link = link_dir.joinpath(f"{job_id}.{p.name}")
+                    if not os.path.lexists(link):
+                        os.symlink(os.path.relpath(original, link_dir), link)
+                    size = original.stat().st_size if not original.is_dir() else TreeSize(original)
+                    index.append(f"{job_id}\t{instance_id}\t{p}\t{size}\n")
+                else:
+                    text_lines.setdefault(link_dir.joinpath(f"{job_id}.{target.key}.txt"), []).append(f"{p}\n")
+                    value = str(p).replace('\t', ' ').replace('\n', ' ')
+                    index.append(f"{job_id}\t{instance_id}\t{value}\t-\n")
+
+        for path, lines in text_lines.items():
+            with open(path, 'a') as out:
+                out.writelines(lines)
+        for path, lines in index_lines.items():
+            new = not path.exists()
+            with open(path, 'a') as out:
+                if new: out.write("\t".join(self.INDEX_HEADER)+"\n")
+                out.writelines(lines)
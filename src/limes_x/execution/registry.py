@@ -0,0 +1,159 @@
+from __future__ import annotations
+import os
+import sys
+import json
+import hashlib
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from .modules import ComputeModule, Item
+from ..common.fs import WriteJson
+
+def _compile(folder: str) -> dict:
+    m = ComputeModule._load(folder)
+    return {
+        "name": m.name,
+        # relative to the modules folder, which may be moved or copied along with this cache
+        "location": os.path.relpath(m.location, os.path.dirname(os.path.abspath(folder))),
+        "inputs": sorted(i.key for i in m.inputs),
+        "outputs": sorted(o.key for o in m.outputs),
+        "group_by": dict((k.key, v.key) for k, v in m._group_by.items()),
+        "threads": m.threads,
+        "memory_gb": m.memory_gb,
+        "requirements": sorted(m.requirements),
+    }
+
+class ModuleRegistry:
+    """compiled description of every module in a modules folder, cached on disk
+    - an entry is reused while its definition file has the same mtime and size, or failing that, the same hash
+    - stale entries are compiled in parallel, each in a new interpreter, so planning never imports module code
+    and the caller's script is never re-run, as it would be by a spawned process pool
+    - modules made from entries load their procedure on first use, so a job imports only its own module
+    - the cache is written next to the modules if possible, and is otherwise kept in ~/.cache/limes_x
+    - locations are kept relative to the modules folder, so the cache stays valid when the folder is moved or copied
+    """
+    FILE_NAME = ".limesx_registry.json"
+    VERSION = 2 # 1 kept absolute locations
+
+    def __init__(self, modules_path: str|Path, workers: int|None=None) -> None:
+        self.modules_path = Path(os.path.abspath(modules_path))
+        self._workers = workers if workers is not None else min(8, os.cpu_count() or 1)
+        self.compiled: list[str] = []
+
+    def _cache_paths(self):
+        fallback = Path.home().joinpath(".cache/limes_x").joinpath(
+            f"registry-{hashlib.sha1(str(self.modules_path).encode()).hexdigest()[:12]}.json")
+        return [self.modules_path.joinpath(self.FILE_NAME), fallback]
+
+    def _read_cache(self) -> dict[str, dict]:
+        for path in self._cache_paths():
+            try:
+                with open(path) as j:
+                    data = json.load(j)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if data.get("version") == self.VERSION: return data.get("modules", {})
+        return {}
+
+    def _write_cache(self, entries: dict[str, dict]):
+        for path in self._cache_paths():
+            try:
+                os.makedirs(path.parent, exist_ok=True)
+                WriteJson(path, {"version": self.VERSION, "modules": entries}, indent=1)
+                return
+            except OSError:
+                continue
+
+    @classmethod
+    def _hash(cls, definition: Path):
+        with open(definition, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def Load(self) -> list[ComputeModule]:
+        cached = self._read_cache()
+        entries: dict[str, dict] = {}
+        stale: dict[str, tuple[int, int, str]] = {}
+        order: list[str] = []
+        touched = False
+        for dir in os.listdir(self.modules_path):
+            mpath = self.modules_path.joinpath(dir)
+            if not os.path.isdir(mpath): continue
+            definition = mpath.joinpath(ComputeModule.LIB_FOLDER).joinpath(ComputeModule.DEFINITION_FILE_NAME)
+            if not definition.is_file():
+                print(f"[{dir}] failed to load")
+                continue
+            order.append(dir)
+            st = os.stat(definition)
+            entry = cached.get(dir)
+            if entry is not None and not self._location(entry).is_dir(): entry = None
+            if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                entries[dir] = entry
+                continue
+            source_hash = self._hash(definition)
+            if entry is not None and entry["source_hash"] == source_hash:
+                entries[dir] = dict(entry, mtime_ns=st.st_mtime_ns, size=st.st_size)
+                touched = True
+                continue
+            stale[dir] = st.st_mtime_ns, st.st_size, source_hash
+
+        if len(stale) > 0:
+            with ThreadPoolExecutor(max_workers=max(1, min(self._workers, len(stale)))) as pool:
+                futures = dict((dir, pool.submit(self._compile_in_process, self.modules_path.joinpath(dir))) for dir in stale)
+                for dir, f in futures.items():
+                    reply = f.result()
+                    if "entry" not in reply:
+                        # one broken module shouldn't take the rest down with it
+                        print(f"[{dir}] failed to load" + (f": {reply['error']}" if reply["error"] is not None else ""))
+                        continue
+                    entry = reply["entry"]
+                    mtime_ns, size, source_hash = stale[dir]
+                    entries[dir] = dict(entry, mtime_ns=mtime_ns, size=size, source_hash=source_hash)
+                    self.compiled.append(dir)
+
+        if touched or len(self.compiled) > 0 or entries.keys() != cached.keys():
+            self._write_cache(entries)
+        return [self._to_module(entries[dir]) for dir in order if dir in entries]
+
+    def _compile_in_process(self, folder: Path) -> dict:
+        env = os.environ.copy()
+        env["PYTHONPATH"] = ':'.join(os.path.abspath(p) for p in sys.path)
+        p = subprocess.run([sys.executable, "-m", __name__, str(folder)], stdout=subprocess.PIPE, env=env)
+        try:
+            return json.loads(p.stdout)
+        except json.JSONDecodeError:
+            raise RuntimeError(f"failed to compile [{folder.name}], the compiler exited with code [{p.returncode}]")
+
+    def _location(self, entry: dict):
+        return Path(os.path.normpath(self.modules_path.joinpath(entry["location"])))
+
+    def _to_module(self, entry: dict):
+        return ComputeModule(
+            _key=ComputeModule._initializer_key,
+            procedure=None,
+            inputs={Item(k) for k in entry["inputs"]},
+            group_by=dict((Item(k), Item(v)) for k, v in entry["group_by"].items()),
+            outputs={Item(k) for k in entry["outputs"]},
+            location=self._location(entry),
+            name=entry["name"],
+            threads=entry["threads"],
+            memory_gb=entry["memory_gb"],
+            requirements=set(entry["requirements"]),
+            source_hash=entry["source_hash"],
+        )
+
+def _main(folder: str):
+    # the reply goes to the original stdout, anything the module prints goes to stderr
+    reply_to = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+    try:
+        reply = {"entry": _compile(folder)}
+    except AssertionError:
+        reply = {"error": None}
+    except Exception as e:
+        reply = {"error": f"{type(e).__name__}: {e}"}
+    reply_to.write(json.dumps(reply))
+    reply_to.close()
+
+if __name__ == '__main__':
+    _main(sys.argv[1])
@@ -0,0 +1,88 @@
+from __future__ import annotations
+import math
+import random
+
+from .modules import JobResult, Params
+
+class RetryPolicy:
+    """which failed jobs to run again within the same Workflow.Run, when, and with what resources
+    - failures are classified from the error message and the end of the job's stderr as
+    out of memory, transient (node loss, preemption, filesystem hiccups), or an error in the job itself,
+    jobs killed by the executor after params.timeout_sec are classified as timed out
+    - out of memory and transient failures are retried up to [max_attempts] runs in total,
+    errors only with [retry_errors] and timeouts only with [retry_timeouts]
+    - the n-th retry waits [backoff_sec]*[backoff_factor]^(n-1), at most [max_backoff_sec], with some jitter
+    so that jobs that failed together don't all come back at once
+    - after running out of memory, a job gets [memory_factor] times the memory, and [threads_factor] times the threads,
+    that its last attempt ran with, up to [max_mem_gb] and [max_threads]
+    """
+    OOM = "oom"
+    TRANSIENT = "transient"
+    ERROR = "error"
+    TIMEOUT = "timeout"
+
+    OOM_PATTERNS = [
+        "out of memory", "out_of_memory", "oom-kill", "oom_kill", "memoryerror", "cannot allocate memory",
+        "std::bad_alloc", "exceeded memory limit", "memory limit exceeded", "killed signal 9", "exit code 137",
+    ]
+    TRANSIENT_PATTERNS = [
+        "node_fail", "node failure", "preempted", "stale file handle", "input/output error", "timed out",
+        "connection reset", "connection refused", "resource temporarily unavailable", "no space left on device",
+        "missing result manifest", "worker died", "workers while running",
+    ]
+
+    def __init__(self,
+        max_attempts: int=3,
+        backoff_sec: float=30,
+        backoff_factor: float=2,
+        max_backoff_sec: float=3600,
+        retry_errors: bool=False,
+        retry_timeouts: bool=False,
+        memory_factor: float=2,
+        threads_factor: float=1,
+        max_mem_gb: int|None=None,
+        max_threads: int|None=None,
+        jitter: float=0.1,
+    ) -> None:
+        assert max_attempts >= 1
+        self.max_attempts = max_attempts
+        self.backoff_sec = backoff_sec
+        self.backoff_factor = backoff_factor
+        self.max_backoff_sec = max_backoff_sec
+        self.retry_errors = retry_errors
+        self.retry_timeouts = retry_timeouts
+        self.memory_factor = memory_factor
+        self.threads_factor = threads_factor
+        self.max_mem_gb = max_mem_gb
+        self.max_threads = max_threads
+        self.jitter = jitter
+
+    def Classify(self, result: JobResult) -> str:
+        if result.timed_out: return self.TIMEOUT
+        text = " ".join([str(result.error_message)] + (result.err_log[-20:] if result.err_log is not None else [])).lower()
+        if any(p in text for p in self.OOM_PATTERNS): return self.OOM
+        if any(p in text for p in self.TRANSIENT_PATTERNS): return self.TRANSIENT
+        return self.ERROR
+
+    def ShouldRetry(self, kind: str, attempt: int) -> bool:
+        """whether to run again a job whose [attempt]-th run failed with [kind]"""
+        if attempt >= self.max_attempts: return False
+        if kind == self.TIMEOUT: return self.retry_timeouts
+        return kind != self.ERROR or self.retry_errors
+
+    def Delay(self, attempt: int) -> float:
+        """seconds to wait after the [attempt]-th run failed"""
+        delay = min(self.max_backoff_sec, self.backoff_sec*self.backoff_factor**(attempt-1))
+        return delay*(1-self.jitter*random.random())
+
+    def Escalate(self, params: Params, threads: int, mem_gb: int) -> Params:
+        """params for the next attempt of a job that ran out of memory with [params],
+        which gave it [threads] and [mem_gb], see Executor.JobResources
+        """
+        p = params.Copy()
+        p.mem_gb = max(1, math.ceil(mem_gb*self.memory_factor))
+        p.threads = max(1, math.ceil(threads*self.threads_factor))
+        if self.max_mem_gb is not None: p.mem_gb = max(mem_gb, min(p.mem_gb, self.max_mem_gb))
+        if self.max_threads is not None: p.threads = max(threads, min(p.threads, self.max_threads))
+        p.pin_resources = True
+        return p
@@ -1,8 +1,10 @@
 from __future__ import annotations
 # from cobra import Model, Reaction, Metabolite
 # import networkx as nx
-from typing import Literal, Any
+from typing import Callable, Any
 import uuid
+import math
+import heapq
 
 from ..common.utils import PrivateInit
 
@@ -62,71 +64,180 @@ class Transform(PrivateInit):
         return self._id
 
 class DependencySolver:
-    def __init__(self, nodes: list[Transform]) -> None:
+    """plans which transforms to run to make [targets] from [given]
+    - items and transforms form an AND-OR graph: an item needs any one of its producers, a transform needs all of its inputs
+    - Knuth's generalization of Dijkstra finds, for every item, the cheapest way to make it, where a way's cost
+    is its transform's cost plus the cost of each of its inputs, in O(E log V) for E edges and V items
+    - [cost] of a transform must be >= 0, every transform costs 1 by default, which favours the fewest steps
+    - shared inputs are counted once per use, so the plan is optimal for that cost,
+    finding the cheapest set of transforms instead is NP-hard
+    """
+    def __init__(self, nodes: list[Transform], cost: Callable[[Transform], float]|None=None) -> None:
         self.nodes = nodes
         self.production_map: dict[str, list[Transform]] = {}
+        self.consumption_map: dict[str, list[Transform]] = {}
         for n in nodes:
             for prd in n.outs:
                 self.production_map[prd] = self.production_map.get(prd, [])+[n]
-        self._dependency_map: dict[str, list[Transform]] = {}
-        self._c = 0
+            for req in n.ins:
+                self.consumption_map[req] = self.consumption_map.get(req, [])+[n]
+        self._cost = cost if cost is not None else lambda t: 1
+        self._costs: dict[str, float] = {}
+        for n in nodes:
+            c = self._cost(n)
+            assert c >= 0, f"[{n.key}] has a negative cost"
+            self._costs[n.key] = c
+
+    def _shortest(self, given: set[str], targets: set[str]):
+        # cheapest cost of each item and the transform that makes it that cheaply
+        dist: dict[str, float] = {}
+        best: dict[str, Transform] = {}
+        done: set[str] = set()
+        heap: list[tuple[float, int, str]] = []
+        tie = 0
+        def _offer(item: str, cost: float, by: Transform|None):
+            nonlocal tie
+            if item in done or cost >= dist.get(item, math.inf): return
+            dist[item] = cost
+            if by is not None: best[item] = by
+            tie += 1
+            heapq.heappush(heap, (cost, tie, item))
+
+        remaining: dict[str, int] = {}
+        acc: dict[str, float] = {}
+        for n in self.nodes:
+            remaining[n.key] = len(n.ins)
+            acc[n.key] = self._costs[n.key]
+            if len(n.ins) == 0:
+                for o in n.outs: _offer(o, acc[n.key], n)
+        for g in given: _offer(g, 0, None)
+
+        todo = len(targets-given)
+        while len(heap) > 0 and todo > 0:
+            cost, _, item = heapq.heappop(heap)
+            if item in done: continue
+            done.add(item)
+            if item in targets and item not in given: todo -= 1
+            for n in self.consumption_map.get(item, []):
+                remaining[n.key] -= 1
+                acc[n.key] += cost
+                if remaining[n.key] > 0: continue
+                for o in n.outs: _offer(o, acc[n.key], n)
+        return dist, best, done
 
     def Solve(self, given: set[str], targets: set[str]):
-        self._dependency_map = {}
-        self._c = 0
-        result = self._solve(given, targets, [], 0, 0)
+        """transforms to run in dependency order, or False, and the transforms each of them depends on"""
+        dist, best, done = self._shortest(given, targets)
+        if not (targets-given).issubset(done): return False, {}
+
+        order: list[Transform] = []
+        needs: dict[str, list[Transform]] = {}
+        def _visit(item: str):
+            if item in given: return []
+            t = best[item]
+            if t.key not in needs:
+                needs[t.key] = [] # made before its inputs are visited, derivations are acyclic
+                path: list[Transform] = []
+                for i in sorted(t.ins):
+                    path += [p for p in _visit(i) if p not in path]
+                needs[t.key] = path+[t]
+                order.append(t)
+            return needs[t.key]
+        for target in sorted(targets):
+            _visit(target)
+
         dep_map = {}
-        for k, v in self._dependency_map.items():
+        for k, v in needs.items():
             dep_map[k] = [t.reference if t.reference is not None  else t.key for t in v]
-        return result, dep_map
-        
-    def _solve(self, given: set[str], targets: set[str], visited:list, max_depth, depth) -> list[Transform]|Literal[False]:
-        self._c += 1
-        if max_depth != 0 and depth > max_depth:
-            return False
-        if self._c >= 9999:
-            return False
-            
-        res = []
-
-        found = True
-        for target in targets-given: # for each output
-            if target not in self.production_map: # an output can't be made
-                found = False
-                return False
-            paths = self.production_map[target]
-            if len(paths) == 0: # an output does not need an input
-                continue
-
-            best = []
-            found_target = False # for this particular target
-            for node in paths: # for each tool that can make this output
-                if node.key in visited: continue
-
-                if node.key in self._dependency_map: # known: to use this tool, get known required sequence from dict
-                    path = self._dependency_map[node.key]
-                elif node.ins.issubset(given): # tool input is given
-                    path = [node]
-                    self._dependency_map[node.key] = path
-                else:
-                    path = self._solve(given, node.ins, visited+[node.key], len(best), depth+1)
-                    if path == False: continue
-
-                    if node not in path: path.append(node)
-                    self._dependency_map[node.key] = path
-                if len(best)==0 or len(path)<len(best):
-                    found_target = True
-                    best = path
-
-            found = found and found_target
-            res = res + best
-
-        if found:
-            _found = set()
-            result = []
-            for r in res:
-                if r in _found: continue
-                result.append(r)
-                _found.add(r)
-            return result
-        return False   
+        return order, dep_map
+
+    def Explain(self, given: set[str], targets: set[str]) -> list[str]:
+        """why each of [targets] that can't be made from [given] is unreachable, one line per reason"""
+        _, _, done = self._shortest(given, set(self.production_map))
+        reachable = done | given
+        lines: list[str] = []
+        explained: set[str] = set()
+        def _why(item: str, depth: int):
+            pad = "  "*depth
+            if item in explained:
+                lines.append(f"{pad}[{item}] is unreachable, see above")
+                return
+            explained.add(item)
+            producers = self.production_map.get(item, [])
+            if len(producers) == 0:
+                lines.append(f"{pad}[{item}] is not given and no module makes it")
+                return
+            for t in producers:
+                missing = sorted(i for i in t.ins if i not in reachable)
+                lines.append(f"{pad}[{item}] could be made by [{t.key}], which needs {', '.join(f'[{m}]' for m in missing)}")
+                for m in missing: _why(m, depth+1)
+        for target in sorted(targets):
+            if target in reachable: continue
+            _why(target, 0)
+        return lines
+
+class LongestPaths:
+    """longest path between any two nodes of a dependency graph, given as node to children
+    - the graph is sorted topologically once, then each distinct start costs one linear pass,
+    which is remembered with predecessor pointers for every target reachable from it
+    - self loops are ignored, with any other cycle is_dag is False and Path must not be used
+    - tables are shared by graphs with the same edges through For, which keeps the [MAX_SHARED] most recently used
+    """
+    MAX_SHARED = 16
+    _tables: dict[frozenset, LongestPaths] = {}
+
+    @classmethod
+    def For(cls, edges: dict[str, set[str]]):
+        key = frozenset((k, frozenset(v)) for k, v in edges.items())
+        table = cls._tables.pop(key, None)
+        if table is None: table = LongestPaths(edges)
+        cls._tables[key] = table # most recent last
+        while len(cls._tables) > cls.MAX_SHARED:
+            del cls._tables[next(iter(cls._tables))]
+        return table
+
+    def __init__(self, edges: dict[str, set[str]]) -> None:
+        self._children: dict[str, list[str]] = {}
+        indegree: dict[str, int] = {}
+        for k, v in edges.items():
+            indegree.setdefault(k, 0)
+            children = sorted(c for c in v if c != k)
+            self._children[k] = children
+            for c in children: indegree[c] = indegree.get(c, 0)+1
+
+        self._order: list[str] = [n for n, d in indegree.items() if d == 0]
+        i = 0
+        while i < len(self._order):
+            for c in self._children.get(self._order[i], []):
+                indegree[c] -= 1
+                if indegree[c] == 0: self._order.append(c)
+            i += 1
+        self.is_dag = len(self._order) == len(indegree)
+        self._rank = dict((n, i) for i, n in enumerate(self._order))
+        self._from: dict[str, dict[str, str|None]] = {}
+
+    def _table(self, start: str):
+        if start in self._from: return self._from[start]
+        dist: dict[str, int] = {start: 0}
+        pred: dict[str, str|None] = {start: None}
+        for n in self._order[self._rank[start]:]:
+            if n not in dist: continue
+            for c in self._children.get(n, []):
+                if dist[n]+1 > dist.get(c, -1):
+                    dist[c] = dist[n]+1
+                    pred[c] = n
+        self._from[start] = pred
+        return pred
+
+    def Path(self, start: str, target: str) -> list[str]|None:
+        assert self.is_dag
+        if start == target: return [start]
+        if start not in self._rank: return None
+        pred = self._table(start)
+        if target not in pred: return None
+        path = [target]
+        while path[-1] != start:
+            p = pred[path[-1]]
+            assert p is not None
+            path.append(p)
+        return path[::-1]
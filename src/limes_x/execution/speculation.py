@@ -0,0 +1,34 @@
+from __future__ import annotations
+import bisect
+import math
+
+class SpeculationPolicy:
+    """when to start a duplicate of a job that is taking much longer than others of its module
+    - a job is a straggler once it has been running for [factor] times the [quantile] of the run times
+    of its module's completed jobs, and at least [min_sec]
+    - modules with fewer than [min_samples] completed jobs are never speculated on
+    - the duplicate runs in its own output folder, whichever finishes first is kept and the other is stopped
+    - run times are those seen by the workflow, from when a job was given to the executor until its result came back
+    """
+    def __init__(self,
+        quantile: float=0.95,
+        factor: float=1.5,
+        min_samples: int=5,
+        min_sec: float=60,
+    ) -> None:
+        assert 0 < quantile <= 1
+        self.quantile = quantile
+        self.factor = factor
+        self.min_samples = min_samples
+        self.min_sec = min_sec
+        self._runtimes: dict[str, list[float]] = {} # sorted, by module name
+
+    def Record(self, module: str, seconds: float):
+        bisect.insort(self._runtimes.setdefault(module, []), seconds)
+
+    def Threshold(self, module: str) -> float|None:
+        """seconds after which a job of [module] is a straggler, or None if there isn't enough to go on"""
+        times = self._runtimes.get(module, [])
+        if len(times) < max(1, self.min_samples): return None
+        q = times[math.ceil(self.quantile*len(times))-1] # nearest rank
+        return max(self.min_sec, q*self.factor)
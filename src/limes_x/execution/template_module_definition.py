@@ -9,7 +9,7 @@ DEPENDENCY = "image.sif"
 def procedure(context: JobContext) -> JobResult:
     input_path = context.manifest[A]
     output_path = context.output_folder.joinpath('copied_file')
-    context.shell(f"cp {input_path} {output_path}")
+    context.Link(input_path, output_path)
     return JobResult(
         manifest = {
             B: Path(output_path)
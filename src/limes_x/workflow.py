@@ -2,20 +2,27 @@ from __future__ import annotations
 import os, sys
 import shutil
 from pathlib import Path
-from typing import Any, Callable, Iterable, Literal
+from typing import Any, Callable, Iterable, Iterator, Literal
+import csv
 import json
 import uuid
-from threading import Thread, Condition
+from threading import Condition
+from concurrent.futures import ThreadPoolExecutor
 import signal
+import time
 from datetime import datetime as dt
 
-from .execution.solver import DependencySolver
+from .execution.solver import DependencySolver, LongestPaths
 from .common.utils import PrivateInit, Timestamp
+from .common.fs import Link, AUTO_INPUT_LINKS
 # from .compute_module import Item, ComputeModule, Params, JobContext, JobResult
 from .execution.instances import JobInstance, ItemInstance
 from .execution.modules import ComputeModule, Item, JobContext, JobResult, Params
 from .execution.executors import Executor
-from .execution.comms import FileSyncedDictionary
+from .execution.retries import RetryPolicy
+from .execution.speculation import SpeculationPolicy
+from .execution.comms import IoSemaphore
+from .execution.publishing import OutputPublisher
 
 class JobError(Exception):
      def __init__(self, message=""):
@@ -46,11 +53,7 @@ class WorkflowState(PrivateInit):
                 self._add_dependency_mapping(s.name, o.key)
 
         self._group_by_paths: dict[tuple[str, str], list[str]] = {}
-        for s in steps:
-            for target, start in s._group_by.items():
-                group_by_path = self._find_groupby_path(start.key, target.key)
-                assert group_by_path is not None, f"[{target.key}] group by [{start.key}] for [{s.name}] is invalid for this set of compute modules. No path between"
-                self._group_by_paths[(target.key, start.key)] = group_by_path
+        self._find_groupby_paths()
 
         self._changed = False
         self._workspace:Path = workspace
@@ -116,6 +119,7 @@ class WorkflowState(PrivateInit):
                 # group_by from module definition
                 ins = {Item(i) for i in md["in"]}
                 outs = {Item(i) for i in md["out"]}
+                assert name in cm_ref, f"module [{name}] of the saved state isn't part of the workflow"
                 cm = cm_ref[name]
                 assert cm.inputs == ins
                 assert cm.outputs == outs
@@ -200,16 +204,7 @@ class WorkflowState(PrivateInit):
                 dep_map[k] = to
 
         state = WorkflowState(workspace, steps, dependency_map=dep_map, _key=cls._initializer_key)
-        for grp in given:
-            root_instance = ItemInstance(state._gen_id, grp.root_type, grp.root_value)
-            children: dict[str, ItemInstance|list[ItemInstance]] = {}
-            for ii in [ItemInstance(state._gen_id, i, p) for i, ps in grp.children.items() for p in ps] + [root_instance]:
-                state._register_item_inst(ii)
-                state._given_item_instances.append(ii.GetID())
-                v = children.get(ii.item_name, [])
-                if not isinstance(v, list): v = [v]
-                children[ii.item_name] =  v + [ii]
-                if ii != root_instance: ii.made_by = root_instance
+        state._register_given(given)
 
         produced: dict[Item, ComputeModule] = {}
         for step in steps:
@@ -226,6 +221,14 @@ class WorkflowState(PrivateInit):
 
         return state
 
+    @classmethod
+    def SavedModules(cls, workspace: str|Path) -> list[str]:
+        """names of the modules in the state saved in [workspace], including any taken in while watching"""
+        path = Path(workspace).joinpath(cls._FILE_NAME)
+        if not os.path.exists(path): return []
+        with open(path) as j:
+            return list(json.load(j)["modules"])
+
     @classmethod
     def ResumeIfPossible(cls, workspace: str|Path, steps: list[ComputeModule], given: list[InputGroup]):
         workspace = Path(workspace)
@@ -235,6 +238,46 @@ class WorkflowState(PrivateInit):
             assert given is not None
             return WorkflowState.MakeNew(workspace, steps, given)
 
+    def _register_given(self, given: Iterable[InputGroup]):
+        for grp in given:
+            root_instance = ItemInstance(self._gen_id, grp.root_type, grp.root_value)
+            children: dict[str, ItemInstance|list[ItemInstance]] = {}
+            for ii in [ItemInstance(self._gen_id, i, p) for i, ps in grp.children.items() for p in ps] + [root_instance]:
+                self._register_item_inst(ii)
+                self._given_item_instances.append(ii.GetID())
+                v = children.get(ii.item_name, [])
+                if not isinstance(v, list): v = [v]
+                children[ii.item_name] =  v + [ii]
+                if ii != root_instance: ii.made_by = root_instance
+
+    def AddInputs(self, given: list[InputGroup], steps: list[ComputeModule]=list()):
+        """merges input groups into the state of a running workflow,
+        along with any of [steps] they need that aren't part of it yet, Update makes their jobs
+        """
+        known = {s.name for s in self._steps}
+        produced = {o for s in self._steps for o in s.GetUnmaskedOutputs()}
+        for step in steps:
+            if step.name in known: continue
+            known.add(step.name)
+            step.output_mask = set()
+            for item in step.outputs:
+                if item in produced:
+                    print(f"[{item.key}] is already produced, masking this output of [{step.name}]")
+                    step.MaskOutput(item)
+                else:
+                    produced.add(item)
+            self._steps.append(step)
+            for i in step.inputs:
+                self._add_dependency_mapping(i.key, step.name)
+            for o in step.GetUnmaskedOutputs():
+                self._add_dependency_mapping(step.name, o.key)
+        for grp in given:
+            for ch in grp.children:
+                self._add_dependency_mapping(grp.root_type.key, ch.key)
+        self._find_groupby_paths()
+        self._register_given(given)
+        self._changed = True
+
     def _gen_id(self, id_len: int):
         while True:
             id = uuid.uuid4().hex[:id_len]
@@ -256,6 +299,18 @@ class WorkflowState(PrivateInit):
         mapped.add(end)
         self._parent_map[start] = mapped
 
+    def _find_groupby_paths(self):
+        self._group_by_paths = {}
+        longest = LongestPaths.For(self._parent_map)
+        for s in self._steps:
+            for target, start in s._group_by.items():
+                if longest.is_dag:
+                    group_by_path = longest.Path(start.key, target.key)
+                else: # enumerate paths when modules depend on each other in a cycle
+                    group_by_path = self._find_groupby_path(start.key, target.key)
+                assert group_by_path is not None, f"[{target.key}] group by [{start.key}] for [{s.name}] is invalid for this set of compute modules. No path between"
+                self._group_by_paths[(target.key, start.key)] = group_by_path
+
     def _find_groupby_path(self, start: str, target: str):
         class Todo:
             def __init__(self, node: str, path: list[str]) -> None:
@@ -508,6 +563,8 @@ class WorkflowState(PrivateInit):
             break
         
         deleted_jobs_folders = [ji.GetFolderName() for ji in job_instances_to_delete]
+        # outputs of a job may be in the folder of its duplicate, see SpeculationPolicy
+        deleted_jobs_folders += [f for f in (ji.Duplicate().GetFolderName() for ji in job_instances_to_delete) if self._workspace.joinpath(f).exists()]
         NL = '\n'
 
         old_save = self._get_save()
@@ -581,10 +638,10 @@ class Sync:
             self.queue.append(item)
             self.lock.notify()
 
-    def WaitAll(self) -> list[JobResult|None]:
+    def WaitAll(self, timeout: float|None=None) -> list[JobResult|None]:
         with self.lock:
             if len(self.queue)==0:
-                self.lock.wait()
+                self.lock.wait(timeout)
 
             results = self.queue.copy()
             self.queue.clear()
@@ -620,9 +677,64 @@ class InputGroup:
         self.root_value: str|Path = abs_path_if_path(root_value)
         self.children: dict[Item, list[str]|list[Path]] = dict((k, [abs_path_if_path(p) for p in v] if isinstance(v, list) else [abs_path_if_path(v)]) for k, v in children.items())
 
-    def _record_input_paths(self, links: list[tuple[str, Path]], inputs_dir: Path):
+    @classmethod
+    def FromSampleSheet(cls, sheet: str|Path, group_by: str, paths: Iterable[str]=tuple(), delimiter: str|None=None, list_separator: str=";") -> Iterator[InputGroup]:
+        """reads input groups from a table one row at a time, without loading the whole sheet
+        - the header names the Item of each column, and [group_by] is the column to group by
+        - values in the columns named in [paths] are files or folders, relative ones are relative to the sheet
+        - a cell can hold a list of values separated by [list_separator], empty cells are skipped
+        - tab separated unless the file ends with .csv, lines starting with # are ignored
+        """
+        sheet = Path(os.path.abspath(sheet))
+        if delimiter is None: delimiter = "," if sheet.suffix.lower() == ".csv" else "\t"
+        paths = set(paths)
+        with open(sheet, newline="") as f:
+            reader = csv.reader((l for l in f if not l.startswith("#")), delimiter=delimiter)
+            header = [h.strip() for h in next(reader)]
+            assert group_by in header, f"[{group_by}] isn't a column of [{sheet}]"
+            missing = paths - set(header)
+            assert len(missing) == 0, f"[{', '.join(missing)}] aren't columns of [{sheet}]"
+            items = [Item(h) for h in header]
+            for row_num, row in enumerate(reader, start=2):
+                if len(row) == 0 or all(c.strip() == "" for c in row): continue
+                assert len(row) <= len(header), f"row {row_num} of [{sheet}] has more cells than the header"
+                root: str|Path|None = None
+                children: dict[Item, list[str]|list[Path]] = {}
+                for h, item, cell in zip(header, items, row):
+                    values = [v.strip() for v in cell.split(list_separator)] if h != group_by else [cell.strip()]
+                    values = [v for v in values if v != ""]
+                    if len(values) == 0: continue
+                    parsed: Any = [sheet.parent.joinpath(os.path.expanduser(v)) for v in values] if h in paths else values
+                    if h == group_by:
+                        root = parsed[0]
+                    else:
+                        children[item] = parsed
+                assert root is not None, f"row {row_num} of [{sheet}] has no [{group_by}]"
+                yield InputGroup((Item(group_by), root), children)
+
+    def ToDict(self):
+        _value = lambda v: {"path": str(v)} if isinstance(v, Path) else v
+        return {
+            "group_by": [self.root_type.key, _value(self.root_value)],
+            "children": dict((k.key, [_value(v) for v in vs]) for k, vs in self.children.items()),
+        }
+
+    @classmethod
+    def FromDict(cls, d: dict):
+        _value = lambda v: Path(v["path"]) if isinstance(v, dict) else str(v)
+        root, root_value = d["group_by"]
+        return InputGroup((Item(root), _value(root_value)), dict((Item(k), [_value(v) for v in vs]) for k, vs in d["children"].items()))
+
+    def _paths(self):
+        if isinstance(self.root_value, Path): yield self.root_value
+        for values in self.children.values():
+            for p in values:
+                if isinstance(p, Path): yield p
+
+    @classmethod
+    def _record_input_paths(cls, links: list[tuple[str, Path]], folder: Path):
         recorded_paths = set()
-        paths_file = inputs_dir.joinpath("input_paths.tsv")
+        paths_file = folder.joinpath("input_paths.tsv")
         if paths_file.exists():
             with open(paths_file) as tsv:
                 for l in tsv:
@@ -640,55 +752,57 @@ class InputGroup:
             tsv.writelines([f"{TAB.join(t)}\n" for t in new_paths])
 
     @classmethod
-    def LinkInputs(cls, workspace: Path, inputs: Iterable[InputGroup]) -> Iterable[InputGroup]:
-        here = os.getcwd()
-        os.chdir(workspace)
+    def LinkInputs(cls, workspace: Path, inputs: Iterable[InputGroup], strategy: str|list[str]="symlink", workers: int=16) -> list[InputGroup]:
+        """links every path given into the inputs folder of [workspace] and points the groups to the links
+        - each distinct path is checked and linked once, in parallel batches, which hides the latency of network filesystems
+        - paths with the same file name are numbered to keep their links apart
+        - input_paths.tsv, from link name to original path, is written once at the end
+        """
+        workspace = Path(os.path.abspath(workspace))
         input_dir = Path(Workflow.INPUT_DIR)
-        
-        _seen, _linked = {}, {}
-        def _mark_seen(p: Path):
-            k = p.name
-            _seen[k] = _seen.get(k, 0)+1
-        def _get_num(p: Path):
-            k = p.name
-            if _seen.get(k, 0) == 1: return None
-            num = _linked.get(k, 1)
-            _linked[k] = num+1
-            return num
-        
-        links = []
-        def _fix(item, path):
-            assert os.path.exists(path), f"given [{path}] doesn't exist"
-            num = _get_num(path)
-            link_name = path.name if num is None else f"{num:04}--{path.name}"
-            linked = input_dir.joinpath(link_name)
-            os.symlink(path, linked)
-            links.append((link_name, path))
-            return linked
+        inputs = list(inputs)
 
+        unique: dict[Path, None] = {} # ordered set
         for ig in inputs:
-            if isinstance(ig.root_value, Path):
-                _mark_seen(ig.root_value)
-            for item in list(ig.children):
-                for p in ig.children[item]:
-                    if isinstance(p, str): continue
-                    _mark_seen(p)
+            for p in ig._paths(): unique.setdefault(p)
+        paths = list(unique)
+
+        BATCH = 256
+        batches = [paths[i:i+BATCH] for i in range(0, len(paths), BATCH)]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            exists = [e for batch in pool.map(lambda b: [os.path.exists(p) for p in b], batches) for e in batch]
+            missing = [str(p) for p, e in zip(paths, exists) if not e]
+            assert len(missing) == 0, f"{len(missing)} given paths don't exist, such as [{'], ['.join(missing[:5])}]"
+
+            # links already made by earlier submissions to a running workflow are kept
+            taken = set(os.listdir(workspace.joinpath(input_dir))) if workspace.joinpath(input_dir).exists() else set()
+            _seen, _linked = {}, {}
+            for p in paths:
+                _seen[p.name] = _seen.get(p.name, 0)+1
+            links: dict[Path, str] = {}
+            for p in paths:
+                if _seen[p.name] == 1 and p.name not in taken:
+                    links[p] = p.name
+                    taken.add(p.name)
+                    continue
+                num = _linked.get(p.name, 1)
+                while f"{num:04}--{p.name}" in taken: num += 1
+                _linked[p.name] = num+1
+                links[p] = f"{num:04}--{p.name}"
+                taken.add(links[p])
+
+            os.makedirs(workspace.joinpath(input_dir), exist_ok=True)
+            if strategy == "auto": strategy = AUTO_INPUT_LINKS
+            def _link(batch: list[Path]):
+                for p in batch: Link(p, workspace.joinpath(input_dir).joinpath(links[p]), strategy)
+            for _ in pool.map(_link, batches): pass
 
         for ig in inputs:
             if isinstance(ig.root_value, Path):
-                ig.root_value = _fix(ig.root_type, ig.root_value)
+                ig.root_value = input_dir.joinpath(links[ig.root_value])
             for item in list(ig.children):
-                parsed = []
-                for p in ig.children[item]:
-                    if isinstance(p, str):
-                        parsed.append(p)
-                        continue
-                    linked = _fix(item, p)
-                    parsed.append(linked)
-                ig.children[item] = parsed
-            ig._record_input_paths(links, workspace)
-
-        os.chdir(here)
+                ig.children[item] = [input_dir.joinpath(links[p]) if isinstance(p, Path) else p for p in ig.children[item]]
+        cls._record_input_paths([(links[p], p) for p in paths], workspace)
         return inputs
     
     def ListItems(self):
@@ -697,7 +811,8 @@ class InputGroup:
 class Workflow:
     INPUT_DIR = Path("inputs")
     OUTPUT_DIR = Path("outputs")
-    def __init__(self, compute_modules: list[ComputeModule]|Path|str, reference_folder: Path|str) -> None:
+    INPUT_QUEUE_DIR = Path("input_queue")
+    def __init__(self, compute_modules: list[ComputeModule]|Path|str, reference_folder: Path|str, module_costs: dict[str, float]=dict()) -> None:
         if isinstance(compute_modules, Path) or isinstance(compute_modules, str):
             compute_modules = ComputeModule.LoadSet(compute_modules)
 
@@ -707,18 +822,79 @@ class Workflow:
             os.makedirs(self._reference_folder)
         else:
             assert os.path.isdir(self._reference_folder), f"reference folder path exists, but is not a folder: {self._reference_folder}"
-        self._solver = DependencySolver([c.GetTransform() for c in compute_modules])
+        # planning minimizes the total cost of the modules run, each costs 1 unless given
+        self._solver = DependencySolver([c.GetTransform() for c in compute_modules], cost=lambda t: module_costs.get(t.key, 1))
         self._all_modules = compute_modules
 
+        # plans only depend on which kinds of items are given, not on their values,
+        # so they are cached by the set of given item keys and the targets, the modules never change
+        self._plans: dict[tuple[frozenset[str], frozenset[str]], tuple[list|Literal[False], dict]] = {}
+
     def Setup(self, install_type: str):
         for step in self._compute_modules:
             step.Setup(self._reference_folder, install_type)
 
     def _calculate(self, given: Iterable[Item], targets: Iterable[Item]):
-        given_k = {x.key for x in given}
-        targets_k = {x.key for x in targets} 
-        steps, dep_map = self._solver.Solve(given_k, targets_k)
-        return steps, dep_map
+        key = frozenset(x.key for x in given), frozenset(x.key for x in targets)
+        if key not in self._plans:
+            self._plans[key] = self._solver.Solve(set(key[0]), set(key[1]))
+        return self._plans[key]
+
+    def _plan(self, given: list[InputGroup], targets: list[Item]) -> list[ComputeModule]|None:
+        _steps = []
+        shapes = set()
+        for i, ig in enumerate(given):
+            shape = frozenset(x.key for x in ig.ListItems())
+            if shape in shapes: continue # same plan as an earlier group
+            shapes.add(shape)
+            _ig_steps, _ = self._calculate(ig.ListItems(), targets)
+            if _ig_steps is False:
+                print(f'no solution exists for input group {i+1}')
+                for line in self._solver.Explain({x.key for x in ig.ListItems()}, {x.key for x in targets}):
+                    print(f'    {line}')
+                return None
+            _steps += _ig_steps
+        _unique_steps = {}
+        for s in _steps:
+            c: ComputeModule = s.reference
+            if c.name in _unique_steps: continue
+            _unique_steps[c.name] = c
+        return [s for s in _unique_steps.values()]
+
+    @classmethod
+    def Submit(cls, workspace: str|Path, given: Iterable[InputGroup]) -> Path:
+        """queue input groups for a workflow running on [workspace] with watch=True, returns the queued file
+        - each file in the input_queue folder of the workspace is a json line per input group,
+        other tools can drop files there too, as long as they appear atomically
+        """
+        queue = Path(os.path.abspath(workspace)).joinpath(cls.INPUT_QUEUE_DIR)
+        os.makedirs(queue, exist_ok=True)
+        name = f"{dt.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl"
+        tmp = queue.joinpath(f".{name}.tmp")
+        with open(tmp, 'w') as f:
+            for ig in given:
+                f.write(json.dumps(ig.ToDict())+"\n")
+        os.replace(tmp, queue.joinpath(name))
+        return queue.joinpath(name)
+
+    def _take_submissions(self) -> list[tuple[Path, list[InputGroup]]]:
+        # relative to the workspace, like the rest of Run
+        if not self.INPUT_QUEUE_DIR.exists(): return []
+        submissions = []
+        for path in sorted(self.INPUT_QUEUE_DIR.glob("*.jsonl")):
+            try:
+                with open(path) as f:
+                    groups = [InputGroup.FromDict(json.loads(l)) for l in f if l.strip() != ""]
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"rejected [{path.name}], it couldn't be read: {e}")
+                self._file_submission(path, "rejected")
+                continue
+            submissions.append((path, groups))
+        return submissions
+
+    def _file_submission(self, path: Path, outcome: str):
+        os.makedirs(path.parent.joinpath(outcome), exist_ok=True)
+        os.replace(path, path.parent.joinpath(outcome).joinpath(path.name))
 
     def _check_feasible(self, targets: Iterable[Item]):
         steps = self._all_modules
@@ -729,39 +905,36 @@ class Workflow:
         missing = targets - products
         assert missing == set(), f"no module produces these items [{', '.join(str(i) for i in missing)}]"
 
-    def _link_output(self, job_instance: JobInstance, target: Item, values: str|Path|list[str]|list[Path]):
-        _values: Any = values
-        if not isinstance(values, list): _values = [values]
-        if not self.OUTPUT_DIR.exists(): os.makedirs(self.OUTPUT_DIR)
-        def _ok_for_path(c: str):
-            return c.isalpha() or c.isdigit() or c in "-_()[]+=:.?"
-        item_name = "".join([c if _ok_for_path(c) else "_" for c in target.key]).rstrip()
-        output_dir_for_target_item = self.OUTPUT_DIR.joinpath(item_name)
-        if not output_dir_for_target_item.exists(): os.makedirs(output_dir_for_target_item)
-
-        prefix = f"{job_instance.GetID()}"
-        for p in _values: # paths should be relative to ws
-            if isinstance(p, Path) and p.exists():
-                original = Path(f"../../{p}")
-                toks = str(p).split('/')
-                fname = toks[-1]
-                link = f"{prefix}.{fname}"
-                os.symlink(original, output_dir_for_target_item.joinpath(link))
-            else:
-                with open(output_dir_for_target_item.joinpath(f"{prefix}.{target.key}.txt"), 'a') as out:
-                    out.write(f"{p}\n")
-
     def Run(self, workspace: str|Path, targets: Iterable[Item],
-        given: list[InputGroup],
+        given: Iterable[InputGroup],
         executor: Executor, params: Params=Params(),
         regenerate: Literal["failures"]|list[Item]=list(),
         max_concurrent: int = 256,
         max_per_module: dict[str, int] = dict(),
+        timeouts: dict[str, float] = dict(),
+        output_shards: int = 0,
+        watch: bool = False,
+        watch_interval_sec: float = 5,
+        retry: RetryPolicy|None = None,
+        speculate: SpeculationPolicy|None = None,
         _catch_errors: bool = True,
     ):
+        """runs the jobs needed to make [targets] from [given] in [workspace]
+        - jobs of the modules named in [timeouts] are killed after that many seconds, others after params.timeout_sec, if set
+        - with [watch], the workflow keeps running after its jobs are done, and takes in input groups
+        queued with Workflow.Submit, checking every [watch_interval_sec], until stopped with ctrl+c or SIGTERM
+        - with [retry], failed jobs are run again as it allows, see RetryPolicy, otherwise a failed job stays failed
+        - with [speculate], a duplicate is started for jobs taking much longer than others of their module, see SpeculationPolicy,
+        if the executor can cancel the duplicate that loses, e.g. HpcExecutor only with a cancel_procedure
+        """
+        if speculate is not None and not executor.CanCancel():
+            print(f"not speculating, since {type(executor).__name__} can't cancel jobs")
+            speculate = None
         if isinstance(workspace, str): workspace = Path(os.path.abspath(workspace))
         if not workspace.exists():
             os.makedirs(workspace)
+        given = list(given) # may be streamed from a sample sheet
+        targets = list(targets)
         params.reference_folder = self._reference_folder
 
         # abs. path before change to working dir
@@ -769,20 +942,6 @@ class Workflow:
 
         result_sync = Sync()
         watcher = TerminationWatcher(result_sync)
-        def _run_job_async(jobi: JobInstance, procedure: Callable[[], JobResult]):
-            def _job():
-                try:
-                    result = procedure()
-                except Exception as e:
-                    result = JobResult(
-                        exit_code = 1,
-                        error_message = str(e),
-                        made_by = jobi.GetID(),
-                    )
-                result_sync.PushNotify(result)
-        
-            th = Thread(target=_job, daemon=True)
-            th.start()
 
         def _run():
             # make links for inputs in workspace
@@ -796,27 +955,19 @@ class Workflow:
             if not os.path.exists(inputs_dir):
                 os.makedirs(inputs_dir)
                 nonlocal given
-                given = list(InputGroup.LinkInputs(workspace, given))
+                given = list(InputGroup.LinkInputs(workspace, given, params.link_strategy))
             # --------------------------------------------
 
             self._check_feasible(targets)
-            _steps = []
             # look at scratch/cloud_compute/test_deep_grouping.ipynb
             # fails when one input group is "ahead" of the rest 
-            dep_map = {}
-            for i, ig in enumerate(given):
-                _ig_steps, _dep_map = self._calculate(ig.ListItems(), targets)
-                dep_map.update(_dep_map)
-                if _ig_steps is False:
-                    print(f'no solution exists for input group {i+1}')
-                    return
-                _steps += _ig_steps
-            _unique_steps = {}
-            for s in _steps:
-                c: ComputeModule = s.reference
-                if c.name in _unique_steps: continue
-                _unique_steps[c.name] = c
-            steps: list[ComputeModule] = [s for s in _unique_steps.values()]
+            _steps = self._plan(given, targets)
+            if _steps is None: return
+            steps: list[ComputeModule] = _steps
+            # modules taken in while watching aren't needed by [given], but are part of the saved state
+            by_name = dict((m.name, m) for m in self._all_modules)
+            planned = {s.name for s in steps}
+            steps += [by_name[n] for n in WorkflowState.SavedModules('./') if n not in planned and n in by_name]
             print(f'linearized plan: [{" -> ".join(s.name for s in steps)}]')
             state = WorkflowState.ResumeIfPossible('./', steps, given)
             if regenerate == "failures":
@@ -828,80 +979,197 @@ class Workflow:
             state.Update()
             state.Save()
 
-            with FileSyncedDictionary(workspace) as coms:
-                coms.Clear()
+            IoSemaphore(workspace).Clear()
 
-            if len(state.GetPendingJobs()) == 0:
+            if len(state.GetPendingJobs()) == 0 and not watch:
                 print(f'nothing to do')
                 return
 
             executor.PrepareRun(steps, self.INPUT_DIR, params)
             print(f">>> start")
 
+            def _take_in():
+                # merge newly submitted input groups into the running workflow
+                for path, groups in self._take_submissions():
+                    new_steps = self._plan(groups, targets)
+                    if new_steps is None:
+                        print(f"rejected [{path.name}]")
+                        self._file_submission(path, "rejected")
+                        continue
+                    try:
+                        groups = InputGroup.LinkInputs(workspace, groups, params.link_strategy)
+                    except AssertionError as e:
+                        print(f"rejected [{path.name}]: {e}")
+                        self._file_submission(path, "rejected")
+                        continue
+                    added = [s for s in new_steps if s.name not in {x.name for x in steps}]
+                    steps.extend(added)
+                    if len(added) > 0: executor.PrepareModules(added, self.INPUT_DIR, params)
+                    state.AddInputs(groups, added)
+                    self._file_submission(path, "done")
+                    print(f"{Timestamp()} took in {len(groups)} input groups from [{path.name}]")
+                    state.Update()
+                    state.Save()
+
             def sprint(x):
                 with executor._sync:
                     print(x)
 
+            publisher = OutputPublisher(self.OUTPUT_DIR, shard_chars=output_shards)
             jobs_ran = set() # this may be redundant
             jobs_running: dict[str, JobInstance] = {}
             running_per_module: dict[str, int] = {}
-            while not watcher.kill_now:
-                pending_jobs = state.GetPendingJobs()
-                if len(pending_jobs) == 0: break
-
-                for job in pending_jobs:
-                    if watcher.kill_now:
-                        raise KeyboardInterrupt()
+            attempts: dict[str, int] = {}
+            retry_at: dict[str, float] = {} # job id -> when its next attempt may start
+            job_params: dict[str, Params] = {} # for jobs given more resources after running out of memory
+            started: dict[str, float] = {}
+            duplicates: dict[str, tuple[JobInstance, JobInstance]] = {} # job id -> (job, its duplicate)
+            original_of: dict[str, str] = {} # duplicate id -> job id
+            discarded: set[str] = set() # stopped since another copy finished first
+
+            def _params_for(job: JobInstance):
+                p = job_params.get(job.GetID(), params).Copy()
+                if job.step.name in timeouts: p.timeout_sec = timeouts[job.step.name]
+                return p
+
+            def _speculate():
+                # start duplicates of stragglers, once nothing else is waiting for a slot
+                if speculate is None: return
+                now = time.time()
+                for jid, job in list(jobs_running.items()):
                     if len(jobs_running) >= max_concurrent: break
-                    jid = job.GetID()
-                    if jid in jobs_ran: continue
-
+                    if jid in original_of or jid in duplicates or jid in discarded: continue
+                    threshold = speculate.Threshold(job.step.name)
+                    if threshold is None or now-started[jid] < threshold: continue
                     module_name = job.step.name
                     if module_name in max_per_module:
-                        max_for_this_module = max_per_module[module_name]
-                        current_for_this_module = running_per_module.get(module_name, 0)
-                        if current_for_this_module >= max_for_this_module: continue
-                        else: running_per_module[module_name] = current_for_this_module+1
-                    
-                    sprint(f"{Timestamp()} queued {job.step.name}:{jid}")
-                    _run_job_async(job, lambda: executor.Run(job, workspace, params.Copy()))
-                    jobs_running[jid] = job
-                    jobs_ran.add(jid)
-
-                sys.stdout.flush()
-                try:
-                    for result in result_sync.WaitAll():
-                        if result is None:
+                        if running_per_module.get(module_name, 0) >= max_per_module[module_name]: continue
+                        running_per_module[module_name] = running_per_module.get(module_name, 0)+1
+                    dup = job.Duplicate()
+                    did = dup.GetID()
+                    sprint(f"{Timestamp()} queued {module_name}:{did}, {jid} has been running for {now-started[jid]:.0f}s")
+                    executor.Submit(dup, workspace, _params_for(job), result_sync.PushNotify)
+                    jobs_running[did] = dup
+                    started[did] = now
+                    duplicates[jid] = job, dup
+                    original_of[did] = jid
+
+            def _next_straggler():
+                if speculate is None: return None
+                times = []
+                for jid, job in jobs_running.items():
+                    if jid in original_of or jid in duplicates or jid in discarded: continue
+                    threshold = speculate.Threshold(job.step.name)
+                    if threshold is not None: times.append(started[jid]+threshold)
+                return min(times) if len(times) > 0 else None
+
+            try:
+                while not watcher.kill_now:
+                    if watch: _take_in()
+                    pending_jobs = state.GetPendingJobs()
+                    if len(pending_jobs) == 0 and len(discarded) == 0 and not watch: break
+
+                    for job in pending_jobs:
+                        if watcher.kill_now:
                             raise KeyboardInterrupt()
-                        job_instance = jobs_running[result.made_by]
-                        del jobs_running[result.made_by]
-                        mn = job_instance.step.name
-                        if mn in running_per_module: running_per_module[mn] = running_per_module[mn]-1
-                        header = f"{job_instance.step.name}:{result.made_by}"
-                        if not result.error_message is None:
-                            sprint(f"{Timestamp()} failed {header}: [{result.error_message}]")
-                            state.RegisterJobComplete(result.made_by, {})
-                        else:
-                            sprint(f"{Timestamp()} completed {header}")
-                            state.RegisterJobComplete(result.made_by, result.manifest)
-                        if result.manifest is not None:
-                            for t in targets:
-                                if t in result.manifest:
-                                    self._link_output(job_instance, t, result.manifest[t])
-                except KeyboardInterrupt:
-                    print("force stopped")
-
-                state.Update()
-                state.Save()
-                sys.stdout.flush()
-            
-            executor.PrepareRun
+                        if len(jobs_running) >= max_concurrent: break
+                        jid = job.GetID()
+                        if jid in jobs_ran: continue
+                        if jid in retry_at and retry_at[jid] > time.time(): continue
+
+                        module_name = job.step.name
+                        if module_name in max_per_module:
+                            max_for_this_module = max_per_module[module_name]
+                            current_for_this_module = running_per_module.get(module_name, 0)
+                            if current_for_this_module >= max_for_this_module: continue
+                            else: running_per_module[module_name] = current_for_this_module+1
+                    
+                        sprint(f"{Timestamp()} queued {job.step.name}:{jid}")
+                        executor.Submit(job, workspace, _params_for(job), result_sync.PushNotify)
+                        jobs_running[jid] = job
+                        jobs_ran.add(jid)
+                        retry_at.pop(jid, None)
+                        attempts[jid] = attempts.get(jid, 0)+1
+                        started[jid] = time.time()
+                    _speculate()
+
+                    sys.stdout.flush()
+                    # wake up for the next retry or straggler, or else nothing may be running to wake us
+                    timeout = watch_interval_sec if watch else None
+                    wake_at = [t for t in [min(retry_at.values(), default=None), _next_straggler()] if t is not None]
+                    if len(wake_at) > 0:
+                        until_next = max(0, min(wake_at)-time.time())
+                        timeout = until_next if timeout is None else min(timeout, until_next)
+                    try:
+                        for result in result_sync.WaitAll(timeout):
+                            if result is None:
+                                raise KeyboardInterrupt()
+                            rid = result.made_by
+                            job_instance = jobs_running[rid]
+                            del jobs_running[rid]
+                            mn = job_instance.step.name
+                            if mn in running_per_module: running_per_module[mn] = running_per_module[mn]-1
+                            jid = original_of.pop(rid, rid)
+                            elapsed = time.time()-started.pop(rid)
+                            if rid in discarded:
+                                discarded.remove(rid)
+                                shutil.rmtree(workspace.joinpath(job_instance.GetFolderName()), ignore_errors=True)
+                                continue
+                            header = f"{mn}:{rid}"
+
+                            # of a job and its duplicate, the first to finish is kept, unless it failed
+                            if jid in duplicates:
+                                job_instance, dup = duplicates[jid]
+                                other = dup.GetID() if rid == jid else jid
+                                if other in jobs_running:
+                                    if result.error_message is not None:
+                                        sprint(f"{Timestamp()} failed {header}, {other} is still running: [{result.error_message}]")
+                                        continue
+                                    sprint(f"{Timestamp()} stopping {mn}:{other}, {rid} finished first")
+                                    executor.Cancel(jobs_running[other])
+                                    discarded.add(other)
+                                del duplicates[jid]
+
+                            if not result.error_message is None and retry is not None:
+                                kind = retry.Classify(result)
+                                n = attempts.get(jid, 1)
+                                if retry.ShouldRetry(kind, n):
+                                    delay = retry.Delay(n)
+                                    if kind == RetryPolicy.OOM:
+                                        p = job_params.get(jid, params)
+                                        job_params[jid] = retry.Escalate(p, *executor.JobResources(job_instance.step, p))
+                                    sprint(f"{Timestamp()} failed {header} ({kind}, attempt {n} of {retry.max_attempts}), retrying in {delay:.1f}s: [{result.error_message}]")
+                                    retry_at[jid] = time.time()+delay
+                                    jobs_ran.discard(jid)
+                                    continue
+                            if not result.error_message is None:
+                                sprint(f"{Timestamp()} failed {header}: [{result.error_message}]")
+                                state.RegisterJobComplete(jid, {})
+                            else:
+                                sprint(f"{Timestamp()} completed {header}")
+                                if speculate is not None: speculate.Record(mn, elapsed)
+                                state.RegisterJobComplete(jid, result.manifest)
+                            if result.manifest is not None:
+                                for t in targets:
+                                    if t in result.manifest:
+                                        publisher.Publish(job_instance, t, result.manifest[t])
+                    except KeyboardInterrupt:
+                        print("force stopped")
+
+                    state.Update()
+                    state.Save()
+                    sys.stdout.flush()
+            finally:
+                publisher.Close()
 
         original_dir = os.getcwd()
         def _wrap_and_run():
             os.makedirs(workspace, exist_ok=True)
             os.chdir(workspace)
-            _run()
+            try:
+                _run()
+            finally:
+                executor.Shutdown() # e.g. QueueExecutor's local workers
             print("done")
 
         if not _catch_errors: